@@ -0,0 +1,42 @@
+"""
+Benchmark du screener : coût de select_top_actions (décision + top-N + niveaux)
+selon la taille de l'univers, sur des métriques synthétiques (aucun réseau).
+
+    python bench.py [taille ...]
+"""
+import sys, time
+import numpy as np, pandas as pd
+from lib import select_top_actions
+
+def synthetic_metrics(n, seed=0):
+    """Cadre au format compute_metrics pour `n` tickers fictifs."""
+    rng = np.random.default_rng(seed)
+    px = rng.uniform(5, 500, n)
+    ma = lambda sd: px * (1 + rng.normal(0, sd, n))
+    df = pd.DataFrame({
+        "Ticker": [f"T{i:06d}" for i in range(n)], "Close": px,
+        "MA20": ma(0.03), "MA50": ma(0.05), "MA120": ma(0.08), "MA240": ma(0.12),
+        "ATR14": px * rng.uniform(0.005, 0.06, n),
+        "pct_7d": rng.normal(0.005, 0.04, n), "pct_30d": rng.normal(0.01, 0.08, n),
+    })
+    df["trend_score"] = 0.6*(df["Close"]/df["MA20"]-1) + 0.4*(df["Close"]/df["MA50"]-1)
+    df["lt_trend_score"] = 0.6*(df["Close"]/df["MA120"]-1) + 0.4*(df["Close"]/df["MA240"]-1)
+    df["name"] = df["Ticker"]
+    return df
+
+def bench_select(sizes=(500, 2_000, 5_000, 20_000, 100_000), repeat=5):
+    rows = []
+    for n in sizes:
+        df = synthetic_metrics(n)
+        for prof in ("Prudent", "Neutre", "Agressif"):
+            best = min(_timed(select_top_actions, df, prof) for _ in range(repeat))
+            rows.append({"Univers": n, "Profil": prof, "ms": round(best*1000, 2)})
+    return pd.DataFrame(rows).pivot(index="Univers", columns="Profil", values="ms")
+
+def _timed(fn, *args):
+    t = time.perf_counter(); fn(*args); return time.perf_counter() - t
+
+if __name__ == "__main__":
+    sizes = tuple(int(a) for a in sys.argv[1:]) or (500, 2_000, 5_000, 20_000, 100_000)
+    print("select_top_actions — meilleur temps (ms) sur 5 essais")
+    print(bench_select(sizes).to_string())
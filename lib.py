@@ -1,35 +1,314 @@
 # -*- coding: utf-8 -*-
-import os, json, math, re, html, requests
+import os, io, sys, ast, json, math, re, html, time, atexit, bisect, logging, sqlite3, threading, hashlib, pickle, tempfile, requests
 import numpy as np
 import pandas as pd
 import yfinance as yf
-from functools import lru_cache
+from collections import OrderedDict, deque
+from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from multiprocessing import shared_memory
 import nltk
 from nltk.sentiment import SentimentIntensityAnalyzer
 
 # =========================
 # FICHIERS & PRESETS
 # =========================
-DATA_DIR = "data"
+DATA_DIR = os.environ.get("DASH_DATA_DIR", "data")   # répertoire jetable pour les benchs en replay
 MAPPING_PATH = os.path.join(DATA_DIR, "id_mapping.json")
 WL_PATH = os.path.join(DATA_DIR, "watchlist_ls.json")          # ← LS Exchange perso
 PROFILE_PATH = os.path.join(DATA_DIR, "profile.json")
 LAST_SEARCH_PATH = os.path.join(DATA_DIR, "last_search.json")
 
+SETTINGS_DB = os.path.join(DATA_DIR, "settings.db")        # remplace les 4 JSON ci-dessus (importés une fois)
+
 os.makedirs(DATA_DIR, exist_ok=True)
-_defaults = [
-    (MAPPING_PATH, {}),
-    (WL_PATH, []),
-    (PROFILE_PATH, {"profil": "Neutre"}),
-    (LAST_SEARCH_PATH, {"last": "TTE.PA"}),
-]
-for p, default in _defaults:
-    if not os.path.exists(p):
-        with open(p, "w", encoding="utf-8") as f:
-            json.dump(default, f)
 
 UA = {"User-Agent": "Mozilla/5.0"}
 
+# =========================
+# CACHE MÉMOIRE (TTL + TAILLE EN OCTETS)
+# =========================
+_CACHES = {}
+_KW_MARK = object()
+
+def _approx_bytes(v):
+    """Taille estimée d'une valeur mise en cache (DataFrame profond, conteneurs récursifs)."""
+    if isinstance(v, pd.DataFrame): return int(v.memory_usage(index=True, deep=True).sum())
+    if isinstance(v, pd.Series): return int(v.memory_usage(index=True, deep=True))
+    if isinstance(v, np.ndarray): return int(v.nbytes)
+    if isinstance(v, (list, tuple, set, frozenset)):
+        return sys.getsizeof(v) + sum(_approx_bytes(x) for x in v)
+    if isinstance(v, dict):
+        return sys.getsizeof(v) + sum(_approx_bytes(k) + _approx_bytes(x) for k, x in v.items())
+    return sys.getsizeof(v)
+
+def _frame_fp(df):
+    """
+    Empreinte bon marché d'un cadre : forme, colonnes, hachage de l'index et des
+    tickers, dernière date, octets des colonnes numériques. Les textes libres
+    (noms, libellés) n'y entrent pas.
+    """
+    h = hashlib.sha1(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+    if "Ticker" in df.columns:
+        h.update(pd.util.hash_pandas_object(df["Ticker"].astype(str), index=False).to_numpy().tobytes())
+    h.update(np.ascontiguousarray(df.select_dtypes(include=["number", "bool"]).to_numpy(dtype=float, na_value=np.nan)).tobytes())
+    last = pd.to_datetime(df["Date"], errors="coerce").max() if "Date" in df.columns else None
+    return (df.shape, tuple(map(str, df.columns)), str(last), h.hexdigest())
+
+def _frame_key(df, *args, **kw):
+    """Clé ttl_cache pour une fonction dont le 1er argument est un cadre : aucune référence au cadre gardée."""
+    return (_frame_fp(df),) + args + ((_KW_MARK,) + tuple(sorted(kw.items())) if kw else ())
+
+def ttl_cache(ttl=3600, max_bytes=64*2**20, maxsize=None, key=None):
+    """
+    Remplaçant de functools.lru_cache : une entrée expire après `ttl` secondes et
+    les moins récemment utilisées sont évincées dès que la taille estimée dépasse
+    `max_bytes` (ou `maxsize` entrées). `key(*args, **kw)` remplace les arguments
+    comme clé (ex. _frame_key). Expose cache_clear(), cache_info() et
+    cache_invalidate(*args, **kw) ; cache_stats() agrège toutes les fonctions.
+    """
+    def deco(fn):
+        data = OrderedDict()          # clé -> (valeur, t0, octets)
+        lock = threading.RLock()
+        st = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "bytes": 0}
+
+        def _key(args, kw):
+            if key is not None: return key(*args, **kw)
+            return args + ((_KW_MARK,) + tuple(sorted(kw.items())) if kw else ())
+
+        def _drop(k):
+            e = data.pop(k, None)
+            if e is not None: st["bytes"] -= e[2]
+            return e
+
+        @wraps(fn)
+        def wrapper(*args, **kw):
+            k = _key(args, kw)
+            with lock:
+                e = data.get(k)
+                if e is not None:
+                    if time.monotonic() - e[1] < ttl:
+                        data.move_to_end(k); st["hits"] += 1
+                        return e[0]
+                    _drop(k); st["expired"] += 1
+                st["misses"] += 1
+            val = fn(*args, **kw)
+            size = _approx_bytes(val)
+            with lock:
+                _drop(k)
+                if size <= max_bytes:
+                    data[k] = (val, time.monotonic(), size); st["bytes"] += size
+                    while data and (st["bytes"] > max_bytes or (maxsize and len(data) > maxsize)):
+                        _drop(next(iter(data))); st["evictions"] += 1
+            return val
+
+        def cache_clear():
+            with lock:
+                data.clear(); st["bytes"] = 0
+
+        def cache_invalidate(*args, **kw):
+            with lock:
+                return _drop(_key(args, kw)) is not None
+
+        def cache_info():
+            with lock:
+                return dict(st, entries=len(data), ttl=ttl, max_bytes=max_bytes)
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_invalidate = cache_invalidate
+        wrapper.cache_info = cache_info
+        _CACHES[fn.__name__] = wrapper
+        return wrapper
+    return deco
+
+def single_flight(fn):
+    """
+    Coalescence in-process : des appels concurrents avec les mêmes arguments
+    partagent un seul calcul. Le premier appelant exécute `fn`, les autres
+    attendent et reçoivent son résultat (ou son exception). À placer sous
+    @ttl_cache pour ne coalescer que les miss.
+    """
+    inflight = {}
+    lock = threading.Lock()
+
+    @wraps(fn)
+    def wrapper(*args, **kw):
+        k = args + ((_KW_MARK,) + tuple(sorted(kw.items())) if kw else ())
+        with lock:
+            call = inflight.get(k)
+            leader = call is None
+            if leader:
+                call = inflight[k] = {"done": threading.Event()}
+        if not leader:
+            call["done"].wait()
+            if "err" in call: raise call["err"]
+            return call["val"]
+        try:
+            call["val"] = fn(*args, **kw)
+            return call["val"]
+        except BaseException as e:
+            call["err"] = e
+            raise
+        finally:
+            with lock:
+                inflight.pop(k, None)
+            call["done"].set()
+    return wrapper
+
+def cache_stats():
+    """Hits / misses / évictions / octets détenus par chaque fonction en cache."""
+    rows = [dict(function=name, **w.cache_info()) for name, w in _CACHES.items()]
+    return pd.DataFrame(rows, columns=["function","entries","bytes","hits","misses",
+                                       "evictions","expired","ttl","max_bytes"])
+
+# =========================
+# FOURNISSEURS DE DONNÉES (live / enregistrement / rejeu)
+# =========================
+# Tout accès réseau de lib passe par get_provider(). Un fournisseur expose :
+#   download(tickers, **kw)        -> DataFrame brut façon yf.download
+#   company_name(ticker)           -> str | None
+#   dividends(ticker)              -> (Series des dividendes, dernier cours)
+#   http_get(url, params, timeout) -> texte de la réponse
+# DASH_PROVIDER = "live" | "record:<dossier>" | "replay:<dossier>[:latence_s]"
+# download() range les erreurs par ticker signalées par yfinance dans data.attrs["errors"].
+class _YfErrors(logging.Handler):
+    """Capte les erreurs par ticker que yf.download journalise (thread appelant seulement)."""
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread, self.errors = threading.get_ident(), {}
+
+    def emit(self, record):
+        if record.thread != self.thread: return
+        m = re.match(r"\s*(\[.*?\]): (.*)", record.getMessage(), re.S)
+        if not m: return
+        try:
+            syms = ast.literal_eval(m.group(1))
+        except Exception:
+            return
+        for t in syms:
+            self.errors[str(t).upper()] = m.group(2)
+
+class YahooProvider:
+    """Backend live : yfinance + HTTP."""
+    name = "live"
+
+    def download(self, tickers, **kw):
+        log, h = logging.getLogger("yfinance"), _YfErrors()
+        log.addHandler(h)
+        try:
+            data = yf.download(tickers, **kw)
+        finally:
+            log.removeHandler(h)
+        if isinstance(data, pd.DataFrame):
+            data.attrs["errors"] = h.errors
+        return data
+
+    def company_name(self, ticker):
+        t = yf.Ticker(ticker)
+        name = None
+        try:
+            name = t.fast_info.get("shortName", None)
+        except Exception:
+            pass
+        if not name:
+            info = t.get_info()
+            name = info.get("shortName") or info.get("longName")
+        return name
+
+    def dividends(self, ticker):
+        t = yf.Ticker(ticker)
+        div = t.dividends
+        if div is None or div.empty:
+            return pd.Series(dtype=float), math.nan
+        return div, float(t.history(period="5d")["Close"].iloc[-1])
+
+    def http_get(self, url, params=None, timeout=12):
+        r = requests.get(url, params=params, headers=UA, timeout=timeout)
+        r.raise_for_status()
+        return r.text
+
+def _call_key(method, args, kw):
+    # `start` (téléchargements delta) dépend du jour : hors clé, pour rejouer un autre jour
+    kw = {k: ("*" if k == "start" else v) for k, v in kw.items()}
+    raw = repr((method, args, sorted(kw.items())))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class RecordingProvider:
+    """Délègue à `inner` et capture chaque réponse (ou exception) dans `path`."""
+    name = "record"
+
+    def __init__(self, path, inner=None):
+        self.path, self.inner = path, inner or YahooProvider()
+        os.makedirs(path, exist_ok=True)
+
+    def _call(self, method, *args, **kw):
+        p = os.path.join(self.path, _call_key(method, args, kw) + ".pkl")
+        try:
+            res = ("ok", getattr(self.inner, method)(*args, **kw))
+        except Exception as e:
+            res = ("err", e)
+        with open(p + ".tmp", "wb") as f:
+            pickle.dump(res, f)
+        os.replace(p + ".tmp", p)
+        if res[0] == "err": raise res[1]
+        return res[1]
+
+    def download(self, tickers, **kw): return self._call("download", tickers, **kw)
+    def company_name(self, ticker): return self._call("company_name", ticker)
+    def dividends(self, ticker): return self._call("dividends", ticker)
+    def http_get(self, url, params=None, timeout=12): return self._call("http_get", url, params=params, timeout=timeout)
+
+class ReplayProvider:
+    """
+    Rejoue les réponses capturées par RecordingProvider, avec `latency` secondes
+    par appel. Un appel jamais enregistré renvoie une réponse vide (ou lève
+    KeyError si strict=True).
+    """
+    name = "replay"
+    _EMPTY = {"download": pd.DataFrame, "company_name": lambda: None,
+              "dividends": lambda: (pd.Series(dtype=float), math.nan), "http_get": str}
+
+    def __init__(self, path, latency=0.0, strict=False):
+        self.path, self.latency, self.strict = path, float(latency), strict
+
+    def _call(self, method, *args, **kw):
+        if self.latency > 0: time.sleep(self.latency)
+        p = os.path.join(self.path, _call_key(method, args, kw) + ".pkl")
+        if not os.path.exists(p):
+            if self.strict: raise KeyError(f"{method}{args} non enregistré")
+            return self._EMPTY[method]()
+        with open(p, "rb") as f:
+            kind, val = pickle.load(f)
+        if kind == "err": raise val
+        return val
+
+    def download(self, tickers, **kw): return self._call("download", tickers, **kw)
+    def company_name(self, ticker): return self._call("company_name", ticker)
+    def dividends(self, ticker): return self._call("dividends", ticker)
+    def http_get(self, url, params=None, timeout=12): return self._call("http_get", url, params=params, timeout=timeout)
+
+def _provider_from_env(spec):
+    kind, _, rest = (spec or "live").partition(":")
+    if kind == "record":
+        return RecordingProvider(rest or os.path.join(DATA_DIR, "replay"))
+    if kind == "replay":
+        path, _, latency = rest.rpartition(":") if re.search(r":[\d.]+$", rest) else (rest, "", "0")
+        return ReplayProvider(path or os.path.join(DATA_DIR, "replay"), latency=float(latency or 0))
+    return YahooProvider()
+
+_provider = _provider_from_env(os.environ.get("DASH_PROVIDER"))
+
+def get_provider():
+    return _provider
+
+def set_provider(provider):
+    """Change de backend et vide les caches mémoire (le stock disque reste : voir DASH_DATA_DIR)."""
+    global _provider
+    _provider = provider
+    for w in _CACHES.values():
+        w.cache_clear()
+
 # =========================
 # SENTIMENT (VADER)
 # =========================
@@ -46,6 +325,139 @@ try:
 except Exception:
     SIA = None
 
+# =========================
+# RÉGLAGES (SQLite, WAL)
+# =========================
+# Profil, dernière recherche, watchlist LS et mapping LS→Yahoo partagent une table
+# kv(ns, key, value JSON). Lectures servies depuis la mémoire ; la base n'est relue
+# que si une autre connexion a écrit (PRAGMA data_version, vérifié au plus toutes
+# les SETTINGS_CHECK_EVERY s). Écritures transactionnelles (BEGIN IMMEDIATE), donc
+# atomiques et sérialisées entre sessions / processus.
+SETTINGS_CHECK_EVERY = 1.0
+
+class SettingsStore:
+    """Petit magasin clé/valeur JSON par espace de noms, servi depuis la mémoire."""
+    def __init__(self, path, migrate=None):
+        self.path, self._migrate = path, migrate
+        self._lock = threading.RLock()
+        self._conn = None
+        self._data = {}           # ns -> {clé: valeur}, remplacé (jamais muté) à chaque écriture
+        self._pending = {}        # (ns, clé) -> valeur : écritures différées (cf. flush)
+        self._version = None
+        self._checked = -math.inf
+        self.flushed = time.time()
+
+    def _connect(self):
+        if self._conn is None:
+            c = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            c.execute("CREATE TABLE IF NOT EXISTS kv (ns TEXT NOT NULL, key TEXT NOT NULL, "
+                      "value TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (ns, key))")
+            self._conn = c
+            if self._migrate:
+                with self._tx() as cur:
+                    if not cur.execute("SELECT 1 FROM kv WHERE ns='meta' AND key='migrated'").fetchone():
+                        rows = [(ns, k, v) for ns, items in self._migrate().items() for k, v in items.items()]
+                        self._insert(cur, rows + [("meta", "migrated", time.time())], ignore=True)
+        return self._conn
+
+    @contextmanager
+    def _tx(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK"); raise
+        self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _insert(cur, rows, ignore=False):
+        now = time.time()
+        cur.executemany(f"INSERT OR {'IGNORE' if ignore else 'REPLACE'} INTO kv VALUES (?,?,?,?)",
+                        [(ns, k, json.dumps(v, ensure_ascii=False), now) for ns, k, v in rows])
+
+    def _fresh(self):
+        if time.monotonic() - self._checked < SETTINGS_CHECK_EVERY:
+            return self._data
+        with self._lock:
+            c = self._connect()
+            v = c.execute("PRAGMA data_version").fetchone()[0]
+            if v != self._version:
+                data = {}
+                for ns, k, val in c.execute("SELECT ns, key, value FROM kv"):
+                    data.setdefault(ns, {})[k] = json.loads(val)
+                for (ns, k), val in self._pending.items():
+                    data.setdefault(ns, {})[k] = val
+                self._data, self._version = data, v
+            self._checked = time.monotonic()
+        return self._data
+
+    def _set_mem(self, ns, items, replace=False):
+        cur = {} if replace else self._data.get(ns, {})
+        self._data = {**self._data, ns: {**cur, **items}}
+
+    def get(self, ns, key, default=None):
+        return self._fresh().get(ns, {}).get(key, default)
+
+    def items(self, ns):
+        """Vue en lecture seule d'un espace de noms (copier avant de modifier)."""
+        return self._fresh().get(ns, {})
+
+    def put(self, ns, key, value, defer=False):
+        """Écrit une valeur ; `defer` la garde en mémoire jusqu'au prochain flush()."""
+        with self._lock:
+            self._fresh()
+            self._set_mem(ns, {key: value})
+            if defer:
+                self._pending[(ns, key)] = value
+            else:
+                with self._tx() as cur:
+                    self._insert(cur, [(ns, key, value)])
+
+    def put_many(self, ns, items, replace=False):
+        """Écrit plusieurs clés en une transaction ; `replace` vide d'abord l'espace de noms."""
+        with self._lock:
+            self._fresh()
+            with self._tx() as cur:
+                if replace:
+                    cur.execute("DELETE FROM kv WHERE ns=?", (ns,))
+                    self._pending = {k: v for k, v in self._pending.items() if k[0] != ns}
+                self._insert(cur, [(ns, k, v) for k, v in items.items()])
+            self._set_mem(ns, dict(items), replace=replace)
+
+    def pending(self):
+        return len(self._pending)
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._connect()
+                with self._tx() as cur:
+                    self._insert(cur, [(ns, k, v) for (ns, k), v in self._pending.items()])
+                self._pending.clear()
+            self.flushed = time.time()
+
+def _settings_legacy():
+    """Contenu des anciens fichiers JSON, importé une seule fois dans la base."""
+    def _read(path, default):
+        try:
+            return json.load(open(path, "r", encoding="utf-8"))
+        except Exception:
+            return default
+    out = {"settings": {}, "mapping": {}}
+    prof = _read(PROFILE_PATH, {}).get("profil")
+    last = _read(LAST_SEARCH_PATH, {}).get("last")
+    wl = _read(WL_PATH, None)
+    if prof: out["settings"]["profile"] = prof
+    if last: out["settings"]["last_search"] = last
+    if isinstance(wl, list): out["settings"]["watchlist_ls"] = wl
+    mp = _read(MAPPING_PATH, {})
+    if isinstance(mp, dict): out["mapping"] = mp
+    return out
+
+_settings = SettingsStore(SETTINGS_DB, migrate=_settings_legacy)
+
 # =========================
 # PROFILS IA
 # =========================
@@ -60,48 +472,81 @@ def get_profile_params(profile: str):
 
 def load_profile():
     try:
-        return json.load(open(PROFILE_PATH, "r", encoding="utf-8")).get("profil", "Neutre")
+        return _settings.get("settings", "profile", "Neutre")
     except Exception:
         return "Neutre"
 
 def save_profile(p):
     try:
-        json.dump({"profil": p}, open(PROFILE_PATH, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+        _settings.put("settings", "profile", p)
     except Exception:
         pass
 
 def load_last_search():
     try:
-        return json.load(open(LAST_SEARCH_PATH, "r", encoding="utf-8")).get("last", "")
+        return _settings.get("settings", "last_search", "TTE.PA")
     except Exception:
         return ""
 
 def save_last_search(t):
     try:
-        json.dump({"last": t}, open(LAST_SEARCH_PATH, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+        _settings.put("settings", "last_search", t)
     except Exception:
         pass
 
 # =========================
 # MAPPING / LS→YAHOO (optionnel)
 # =========================
+# Mapping = espace de noms "mapping" du SettingsStore (une ligne par symbole : des
+# sessions qui ajoutent des symboles différents ne s'écrasent pas). Résolutions
+# écrites par lots, échecs mémorisés NEG_GUESS_TTL s pour ne pas re-sonder Yahoo.
+MAPPING_FLUSH_EVERY = 20
+MAPPING_FLUSH_DELAY = 30
+NEG_GUESS_TTL = 3600
+
+_failed_guess = {}
+_flush_timer = None
+_flush_timer_lock = threading.Lock()
+
+def _mapping():
+    return _settings.items("mapping")
+
+def flush_mapping():
+    global _flush_timer
+    with _flush_timer_lock:
+        if _flush_timer is not None:
+            _flush_timer.cancel(); _flush_timer = None
+    _settings.flush()
+
+def _mapping_put(raw, yahoo):
+    global _flush_timer
+    _settings.put("mapping", raw, yahoo, defer=True)
+    if (_settings.pending() >= MAPPING_FLUSH_EVERY
+            or time.time() - _settings.flushed >= MAPPING_FLUSH_DELAY):
+        flush_mapping(); return
+    # sans put suivant, les dernières résolutions sont écrites au plus tard après le délai
+    with _flush_timer_lock:
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(MAPPING_FLUSH_DELAY, flush_mapping)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+atexit.register(flush_mapping)
+
 def load_mapping():
-    try:
-        return json.load(open(MAPPING_PATH, "r", encoding="utf-8"))
-    except Exception:
-        return {}
+    return dict(_mapping())
 
 def save_mapping(m):
-    json.dump(m, open(MAPPING_PATH, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+    _settings.put_many("mapping", dict(m), replace=True)
 
 def load_watchlist_ls():
     try:
-        return json.load(open(WL_PATH, "r", encoding="utf-8"))
+        return list(_settings.get("settings", "watchlist_ls", []))
     except Exception:
         return []
 
 def save_watchlist_ls(lst):
-    json.dump(lst, open(WL_PATH, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+    _settings.put("settings", "watchlist_ls", list(lst))
 
 def _norm(s): return (s or "").strip().upper()
 _PARIS = {"AIR","ORA","MC","TTE","BNP","SGO","ENGI","SU","DG","ACA","GLE","RI","KER","HO","EN","CAP","AI","PUB","VIE","VIV","STM"}
@@ -126,39 +571,34 @@ def guess_yahoo_from_ls(ticker: str):
 
 def maybe_guess_yahoo(s):
     s = _norm(s)
-    m = load_mapping().get(s)
+    m = _mapping().get(s)
     return m or guess_yahoo_from_ls(s)
 
 def resolve_identifier(id_or_ticker):
     raw = _norm(id_or_ticker)
     if not raw: return None, {}
-    mapping = load_mapping()
+    mapping = _mapping()
     if raw in mapping:
         return mapping[raw], {"source": "mapping"}
+    failed = _failed_guess.get(raw)
+    if failed and time.time() - failed < NEG_GUESS_TTL:
+        return None, {}
     guess = maybe_guess_yahoo(raw)
-    if guess:
-        try:
-            hist = yf.download(guess, period="5d", interval="1d",
-                               auto_adjust=True, progress=False, threads=False)
-            if not hist.empty:
-                mapping[raw] = guess
-                save_mapping(mapping)
-                return guess, {"source": "heuristic"}
-        except Exception:
-            pass
+    if guess and validate_tickers([guess]).get(_norm(guess)):
+        _mapping_put(raw, guess)
+        return guess, {"source": "heuristic"}
+    _failed_guess[raw] = time.time()
     return None, {}
 
 # =========================
 # RECHERCHE YAHOO
 # =========================
-@lru_cache(maxsize=256)
+@ttl_cache(ttl=24*3600, max_bytes=8*2**20)
 def yahoo_search(query: str, region="FR", lang="fr-FR", quotesCount=20):
     url = "https://query2.finance.yahoo.com/v1/finance/search"
     params = {"q": query, "quotesCount": quotesCount, "newsCount": 0, "lang": lang, "region": region}
     try:
-        r = requests.get(url, params=params, headers=UA, timeout=12)
-        r.raise_for_status()
-        data = r.json()
+        data = json.loads(get_provider().http_get(url, params=params, timeout=12))
         quotes = data.get("quotes", [])
         out = []
         for q in quotes:
@@ -195,10 +635,10 @@ def find_ticker_by_name(company_name: str, prefer_markets=("Paris","XETRA","Fran
 # =========================
 # MEMBRES D’INDICES (CAC40, DAX, NASDAQ100, S&P500)
 # =========================
-@lru_cache(maxsize=32)
+@ttl_cache(ttl=24*3600, max_bytes=64*2**20)
 def _read_tables(url: str):
-    html = requests.get(url, headers=UA, timeout=20).text
-    return pd.read_html(html)
+    html = get_provider().http_get(url, timeout=20)
+    return pd.read_html(io.StringIO(html))
 
 def _extract_name_ticker(tables):
     table=None
@@ -214,28 +654,24 @@ def _extract_name_ticker(tables):
     out["ticker"]=out["ticker"].astype(str).str.strip()
     return out.dropna().drop_duplicates(subset=["ticker"])
 
-@lru_cache(maxsize=8)
-def members_cac40():
+def _build_cac40():
     df=_extract_name_ticker(_read_tables("https://en.wikipedia.org/wiki/CAC_40"))
     df["ticker"]=df["ticker"].apply(lambda x: x if "." in x else f"{x}.PA")
     df["index"]="CAC 40"
     return df
 
-@lru_cache(maxsize=8)
-def members_dax():
+def _build_dax():
     df=_extract_name_ticker(_read_tables("https://en.wikipedia.org/wiki/DAX"))
     df["ticker"]=df["ticker"].apply(lambda x: x if "." in x else f"{x}.DE")
     df["index"]="DAX"
     return df
 
-@lru_cache(maxsize=8)
-def members_nasdaq100():
+def _build_nasdaq100():
     df=_extract_name_ticker(_read_tables("https://en.wikipedia.org/wiki/Nasdaq-100"))
     df["index"]="NASDAQ 100"     # US => pas de suffix Yahoo
     return df
 
-@lru_cache(maxsize=8)
-def members_sp500():
+def _build_sp500():
     # Constituants S&P 500 (table Wikipedia "List of S&P 500 companies")
     tables = _read_tables("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies")
     # Cherche colonnes Symbol / Security
@@ -253,95 +689,743 @@ def members_sp500():
     out["index"]="S&P 500"
     return out.dropna().drop_duplicates(subset=["ticker"])
 
+# Instantanés disque (data/members) : chargement immédiat depuis la dernière liste
+# valide, rafraîchissement Wikipedia en tâche de fond au-delà de MEMBERS_REFRESH,
+# et journal des entrées/sorties de l'indice dans changes.jsonl. Seul le tout
+# premier lancement (aucun instantané) attend Wikipedia.
+MEMBERS_DIR = os.path.join(DATA_DIR, "members")
+MEMBERS_CHANGES_PATH = os.path.join(MEMBERS_DIR, "changes.jsonl")
+MEMBERS_REFRESH = 7*24*3600
+os.makedirs(MEMBERS_DIR, exist_ok=True)
+
+_MEMBERS_BUILDERS = {
+    "CAC 40": _build_cac40,
+    "DAX": _build_dax,
+    "NASDAQ 100": _build_nasdaq100,
+    "S&P 500": _build_sp500,
+}
+_members_mem = {}            # indice -> (DataFrame, fetched)
+_members_refreshing = set()
+_members_lock = threading.Lock()
+
+def _members_path(index_name):
+    return os.path.join(MEMBERS_DIR, re.sub(r"[^a-z0-9]+", "_", index_name.lower()).strip("_") + ".json")
+
+def _members_load(index_name):
+    try:
+        snap = json.load(open(_members_path(index_name), "r", encoding="utf-8"))
+        df = pd.DataFrame(snap["members"], columns=["ticker","name","index"])
+        return (df, float(snap["fetched"])) if not df.empty else None
+    except Exception:
+        return None
+
+def _members_save(index_name, df, previous=None):
+    now = time.time()
+    p = _members_path(index_name); tmp = p + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"index": index_name, "fetched": now,
+                   "members": df[["ticker","name","index"]].to_dict(orient="records")},
+                  f, ensure_ascii=False, indent=1)
+    os.replace(tmp, p)
+    if previous is not None:
+        old, new = set(previous["ticker"]), set(df["ticker"])
+        added, removed = sorted(new - old), sorted(old - new)
+        if added or removed:
+            with open(MEMBERS_CHANGES_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"index": index_name, "date": pd.Timestamp.now().isoformat(timespec="seconds"),
+                                    "added": added, "removed": removed}, ensure_ascii=False) + "\n")
+    return now
+
+def _members_refresh(index_name):
+    """Relit Wikipedia ; en cas d'échec on garde la dernière liste valide."""
+    try:
+        df = _MEMBERS_BUILDERS[index_name]()
+        if df is None or df.empty: return None
+        df = df[["ticker","name","index"]].reset_index(drop=True)
+        prev = _members_mem.get(index_name) or _members_load(index_name)
+        fetched = _members_save(index_name, df, prev[0] if prev else None)
+        _members_mem[index_name] = (df, fetched)
+        return df
+    except Exception:
+        return None
+    finally:
+        with _members_lock:
+            _members_refreshing.discard(index_name)
+
+def _members_refresh_async(index_name):
+    with _members_lock:
+        if index_name in _members_refreshing: return
+        _members_refreshing.add(index_name)
+    threading.Thread(target=_members_refresh, args=(index_name,), daemon=True).start()
+
+@single_flight
 def members(index_name: str):
-    if index_name=="CAC 40": return members_cac40()
-    if index_name=="DAX": return members_dax()
-    if index_name=="NASDAQ 100": return members_nasdaq100()
-    if index_name=="S&P 500": return members_sp500()
-    return pd.DataFrame(columns=["ticker","name","index"])
+    if index_name not in _MEMBERS_BUILDERS:
+        return pd.DataFrame(columns=["ticker","name","index"])
+    snap = _members_mem.get(index_name)
+    if snap is None:
+        snap = _members_load(index_name)
+        if snap is not None:
+            _members_mem[index_name] = snap
+    if snap is None:
+        with _members_lock:
+            _members_refreshing.add(index_name)
+        df = _members_refresh(index_name)
+        return df if df is not None else pd.DataFrame(columns=["ticker","name","index"])
+    if time.time() - snap[1] > MEMBERS_REFRESH:
+        _members_refresh_async(index_name)
+    return snap[0]
+
+def members_cac40(): return members("CAC 40")
+def members_dax(): return members("DAX")
+def members_nasdaq100(): return members("NASDAQ 100")
+def members_sp500(): return members("S&P 500")
 
 # =========================
 # PRIX (AJUSTÉS) & HISTO
 # =========================
-@lru_cache(maxsize=64)
-def fetch_prices_cached(tickers_tuple, period="120d"):
-    tickers=list(tickers_tuple)
-    if not tickers: return pd.DataFrame()
+# Stock OHLCV persistant : 1 fichier Parquet (zstd) par ticker dans data/prices,
+# + un index {ticker: {"start": début couvert, "fetched": epoch du dernier download}}.
+# fetch_prices lit d'abord le stock ; un ticker trop vieux (PRICE_STORE_TTL) est
+# complété par sa seule queue manquante, un ticker absent ou trop court pour la
+# fenêtre demandée est téléchargé en entier.
+PRICES_DIR = os.path.join(DATA_DIR, "prices")
+PRICES_INDEX_PATH = os.path.join(PRICES_DIR, "_index.json")
+PRICE_STORE_TTL = 6*3600
+PRICE_MEM_TTL = 15*60         # résultats assemblés gardés en RAM (relus du stock ensuite)
+DELTA_OVERLAP_DAYS = 7        # recouvrement demandé avant la dernière barre stockée
+DELTA_TOLERANCE = 0.002       # écart max sur le recouvrement (sinon ré-ajustement Yahoo)
+# Fenêtres courtes (« 1 jour », « Jour ») : comme range=2d/5d chez Yahoo, on rend les
+# N dernières séances et non N jours calendaires (week-end, jours fériés).
+SHORT_WINDOW_DAYS = 10
+SHORT_WINDOW_PAD = 10         # jours calendaires synchronisés en plus pour trouver N séances
+
+# Moteur de téléchargement : chunks de DL_CHUNK_SIZE tickers dans un pool borné,
+# retry avec backoff exponentiel par chunk, et délai global pour l'ensemble.
+DL_CHUNK_SIZE = 40
+DL_MAX_WORKERS = 8
+DL_RETRIES = 2
+DL_BACKOFF = 1.5
+DL_DEADLINE = 90
+os.makedirs(PRICES_DIR, exist_ok=True)
+
+try:
+    import pyarrow  # noqa: F401  (installé avec streamlit)
+    _PRICE_EXT = ".parquet"
+except ImportError:
+    _PRICE_EXT = ".pkl"
+
+_OHLCV = ["Open","High","Low","Close","Volume"]
+_store_lock = threading.RLock()
+_store_idx = None
+_ticker_locks = {}
+
+def _period_days(period):
+    m = re.fullmatch(r"(\d+)(d|mo|y)", str(period))
+    if not m: return None
+    n, unit = int(m.group(1)), m.group(2)
+    return n if unit=="d" else (n*31 if unit=="mo" else n*366)
+
+def _price_path(t):
+    return os.path.join(PRICES_DIR, re.sub(r"[^A-Za-z0-9._^=-]", "_", t) + _PRICE_EXT)
+
+def _ticker_lock(t):
+    """Verrou par ticker : lecture du stock, fusion, écriture et remplacement d'un bloc."""
+    with _store_lock:
+        return _ticker_locks.setdefault(t, threading.RLock())
+
+def _store_index():
+    global _store_idx
+    with _store_lock:
+        if _store_idx is None:
+            try:
+                _store_idx = json.load(open(PRICES_INDEX_PATH, "r", encoding="utf-8"))
+            except Exception:
+                _store_idx = {}
+        return _store_idx
+
+def _store_flush():
+    """Écrit l'index (atomique) en fusionnant avec la version disque d'un autre process."""
+    with _store_lock:
+        idx = _store_index()
+        try:
+            disk = json.load(open(PRICES_INDEX_PATH, "r", encoding="utf-8"))
+        except Exception:
+            disk = {}
+        for t, meta in disk.items():
+            if meta.get("fetched", 0) > idx.get(t, {}).get("fetched", 0):
+                idx[t] = meta
+        tmp = PRICES_INDEX_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(idx, f)
+        os.replace(tmp, PRICES_INDEX_PATH)
+
+def _store_read(t):
+    p = _price_path(t)
     try:
-        data=yf.download(
-            tickers, period=period, interval="1d",
-            auto_adjust=True, group_by="ticker", threads=False, progress=False
-        )
+        if os.path.exists(p):
+            df = pd.read_parquet(p) if _PRICE_EXT==".parquet" else pd.read_pickle(p)
+            df["Date"] = df["Date"].astype("datetime64[ns]")
+            return df
     except Exception:
-        return pd.DataFrame()
-    if data is None or len(data)==0: return pd.DataFrame()
-    frames=[]
+        pass
+    return pd.DataFrame(columns=["Date"]+_OHLCV)
+
+@ttl_cache(ttl=PRICE_MEM_TTL, max_bytes=512*2**20)
+def _ticker_history(t):
+    """Historique stocké complet d'un ticker, partagé en RAM par toutes les fenêtres."""
+    return _store_read(t)
+
+def _store_write(t, df, start):
+    p = _price_path(t)
+    fd, tmp = tempfile.mkstemp(dir=PRICES_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        if _PRICE_EXT==".parquet":
+            df.to_parquet(tmp, index=False, compression="zstd")
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, p)
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+    _ticker_history.cache_invalidate(t)
+    with _store_lock:
+        _store_index()[t] = {"start": str(start.date()), "fetched": time.time()}
+
+def _store_covers(meta, start, now):
+    if not meta: return False
+    return (now - meta.get("fetched", 0) < PRICE_STORE_TTL) and pd.Timestamp(meta["start"]) <= start
+
+def _split_download(data, tickers):
+    """Réponse yf.download → {ticker: DataFrame(Date, OHLCV)} sans lignes vides."""
+    raw={}
     if isinstance(data,pd.DataFrame) and {"Open","High","Low","Close"}.issubset(data.columns):
-        df=data.copy(); df["Ticker"]=tickers[0]; frames.append(df)
+        raw[tickers[0]]=data
     else:
         for t in tickers:
             try:
                 if t in data and isinstance(data[t],pd.DataFrame):
-                    df=data[t].copy(); df["Ticker"]=t; frames.append(df)
+                    raw[t]=data[t]
             except Exception:
                 continue
+    out={}
+    for t, df in raw.items():
+        df=df.reset_index()
+        df=df.rename(columns={df.columns[0]:"Date"})[["Date"]+[c for c in _OHLCV if c in df.columns]]
+        df["Date"]=pd.to_datetime(df["Date"]).astype("datetime64[ns]")
+        df=df.dropna(subset=[c for c in ("Open","High","Low","Close") if c in df.columns], how="all")
+        if not df.empty: out[t]=df
+    return out
+
+def _missing_symbol(err):
+    """Erreur yfinance propre au symbole (inconnu / délisté), par opposition à un incident réseau."""
+    return err is None or "delisted" in err.lower()
+
+def _download_chunk(chunk, kw, deadline):
+    """
+    Un chunk avec retry/backoff ; renvoie ({ticker: df}, tickers sans réponse avérée).
+    yfinance rend un cadre vide (sans lever) sur coupure réseau ou 429 : un ticker
+    sans barre n'est donc tenu pour inconnu de Yahoo que si d'autres tickers du même
+    chunk ont des données et que son erreur éventuelle vise le symbole lui-même.
+    Seuls une exception ou un chunk entièrement vide sont réessayés.
+    """
+    got, errors = {}, {}
+    for attempt in range(DL_RETRIES+1):
+        try:
+            data=get_provider().download(
+                chunk, interval="1d", auto_adjust=True, group_by="ticker",
+                threads=False, progress=False, **kw
+            )
+            if data is not None and len(data):
+                got=_split_download(data, chunk)
+            errors=getattr(data, "attrs", {}).get("errors") or {}
+        except Exception:
+            pass
+        wait=DL_BACKOFF*(2**attempt)
+        if got or attempt==DL_RETRIES or time.monotonic()+wait>deadline:
+            break
+        time.sleep(wait)
+    if not got:
+        return got, list(chunk)
+    return got, [t for t in chunk if t not in got and not _missing_symbol(errors.get(t.upper()))]
+
+def _download(tickers, **kw):
+    """
+    Téléchargement parallèle par chunks. Renvoie ({ticker: df}, failed) où `failed`
+    liste les tickers sans réponse avérée (réseau, 429, délai global, chunk vide) —
+    à ne pas confondre avec un ticker inconnu de Yahoo (ni dans l'un ni dans l'autre).
+    """
+    tickers=list(dict.fromkeys(tickers))
+    if not tickers: return {}, []
+    deadline=time.monotonic()+DL_DEADLINE
+    chunks=[tickers[i:i+DL_CHUNK_SIZE] for i in range(0, len(tickers), DL_CHUNK_SIZE)]
+    if len(chunks)==1:
+        return _download_chunk(chunks[0], kw, deadline)
+
+    got, failed, done = {}, [], set()
+    pool=ThreadPoolExecutor(max_workers=min(DL_MAX_WORKERS, len(chunks)))
+    futs={pool.submit(_download_chunk, c, kw, deadline): i for i, c in enumerate(chunks)}
+    try:
+        for f in as_completed(futs, timeout=max(0.0, deadline-time.monotonic())):
+            g, fl = f.result()
+            got.update(g); failed += fl; done.add(futs[f])
+    except FuturesTimeout:
+        pass
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    for i, c in enumerate(chunks):
+        if i not in done: failed += c
+    return got, failed
+
+def _store_update(tickers, period, start, replace=False):
+    """
+    Télécharge `tickers` sur `period` et fusionne avec l'historique déjà stocké.
+    Renvoie les tickers restés sans réponse (exception, délai global).
+    """
+    got, failed = _download(tickers, period=period)
+    failed=set(failed)            # réseau KO / délai dépassé : on garde le stock tel quel
+    for t in tickers:
+        with _ticker_lock(t):
+            meta=_store_index().get(t) or {}
+            old=_ticker_history(t) if not (meta.get("empty") or replace) else pd.DataFrame()
+            new=got.get(t)
+            if new is None:
+                # Ticker inconnu de Yahoo : négatif mémorisé jusqu'au prochain TTL
+                if old.empty and t not in failed:
+                    with _store_lock:
+                        _store_index()[t]={"start": str(start.date()), "fetched": time.time(), "empty": True}
+                continue
+            covered=start
+            if not old.empty:
+                new=pd.concat([old, new], ignore_index=True)
+                covered=min(start, pd.Timestamp(meta.get("start", start)))
+            new=new.drop_duplicates(subset=["Date"], keep="last").sort_values("Date").reset_index(drop=True)
+            _store_write(t, new, covered)
+    _store_flush()
+    return sorted(failed)
+
+def _store_delta(tickers):
+    """
+    Mise à jour incrémentale : ne demande que la queue manquante depuis la dernière
+    barre stockée (moins DELTA_OVERLAP_DAYS de recouvrement). Si le recouvrement ne
+    colle plus (dividende/split ré-ajusté par Yahoo), le ticker est renvoyé pour
+    un re-téléchargement complet.
+    """
+    idx=_store_index()
+    olds, groups = {}, {}
+    for t in tickers:
+        old=_ticker_history(t)
+        if old.empty: continue
+        olds[t]=old
+        since=old["Date"].max().normalize()-pd.Timedelta(days=DELTA_OVERLAP_DAYS)
+        groups.setdefault(since, []).append(t)
+
+    redo=[t for t in tickers if t not in olds]
+    for since, group in groups.items():
+        got, failed = _download(group, start=since.strftime("%Y-%m-%d"))
+        failed=set(failed)
+        for t in group:
+            new=got.get(t)
+            if new is None:
+                # Sans barre alors que le chunk a répondu pour d'autres tickers
+                # (cotation suspendue, délisté) : pas de nouvelle sonde avant
+                # PRICE_STORE_TTL. Sans réponse avérée (`failed`) : on réessaiera.
+                if t not in failed:
+                    with _store_lock:
+                        idx[t]=dict(idx[t], fetched=time.time())
+                continue
+            with _ticker_lock(t):
+                old=_ticker_history(t)     # relu sous verrou : un autre écrivain a pu passer
+                if old.empty: old=olds[t]
+                # la dernière barre stockée peut être une barre intraday partielle
+                chk=old[old["Date"]<old["Date"].max()].merge(new, on="Date", suffixes=("_o","_n"))
+                chk=chk[["Close_o","Close_n"]].dropna()
+                if not chk.empty and (chk["Close_n"]/chk["Close_o"]-1).abs().max()>DELTA_TOLERANCE:
+                    redo.append(t); continue
+                merged=(pd.concat([old, new], ignore_index=True)
+                          .drop_duplicates(subset=["Date"], keep="last")
+                          .sort_values("Date").reset_index(drop=True))
+                _store_write(t, merged, pd.Timestamp(idx[t]["start"]))
+    _store_flush()
+    return redo
+
+def _store_sync(tickers, days, force=False):
+    """
+    Met le stock à jour pour `tickers` sur `days` jours. Renvoie (début de fenêtre,
+    tickers re-téléchargés restés sans réponse du fournisseur).
+    """
+    start=pd.Timestamp.today().normalize()-pd.Timedelta(days=days)
+    now=time.time()
+    idx=_store_index()
+    stale=[t for t in tickers if force or not _store_covers(idx.get(t), start, now)]
+    if not stale: return start, []
+
+    def _deltable(t):
+        meta=idx.get(t)
+        return bool(meta) and not meta.get("empty") and pd.Timestamp(meta["start"])<=start
+    delta=[t for t in stale if _deltable(t)]
+    full=[t for t in stale if not _deltable(t)]
+
+    redo=_store_delta(delta) if delta else []
+    failed=[]
+    if redo:
+        # ré-ajustement : on remplace tout l'historique stocké de ces tickers
+        first=min(pd.Timestamp(idx.get(t, {}).get("start", start)) for t in redo)
+        span=max(days, (pd.Timestamp.today().normalize()-first).days)
+        failed+=_store_update(redo, f"{span}d", min(first, start), replace=True)
+    if full:
+        failed+=_store_update(full, f"{days}d", start)
+    return start, failed
+
+def _canon_tickers(tickers):
+    """Clé canonique : tickers nettoyés, en majuscules, dédoublonnés et triés."""
+    return tuple(sorted({str(t).strip().upper() for t in tickers
+                         if isinstance(t, str) and t.strip()}))
+
+# Le résultat assemblé n'est gardé que pour les appels répétés à l'identique :
+# toute autre combinaison (sous-ensemble de tickers, horizon plus court) est
+# découpée dans _ticker_history sans réseau ni disque.
+@ttl_cache(ttl=PRICE_MEM_TTL, max_bytes=64*2**20)
+@single_flight
+def fetch_prices_cached(tickers_tuple, period="120d"):
+    tickers=list(_canon_tickers(tickers_tuple))
+    if not tickers: return pd.DataFrame()
+    days=_period_days(period)
+    if days is None:
+        got, _ = _download(tickers, period=period)
+        frames=[df.assign(Ticker=t) for t, df in got.items()]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    frames=[df.assign(Ticker=t) for t, df in _stored_window(tickers, days)]
     if not frames: return pd.DataFrame()
-    out=pd.concat(frames); out.reset_index(inplace=True); return out
+    return pd.concat(frames, ignore_index=True)
+
+def _stored_window(tickers, days):
+    """Synchronise le stock puis renvoie [(ticker, historique de la fenêtre)] (vues, sans copie)."""
+    short=days<=SHORT_WINDOW_DAYS
+    start, _ = _store_sync(tickers, days+SHORT_WINDOW_PAD if short else days)
+    idx=_store_index()
+    out=[]
+    for t in tickers:
+        if (idx.get(t) or {}).get("empty"): continue
+        df=_ticker_history(t)
+        df=df.iloc[-days:] if short else df.iloc[df["Date"].searchsorted(start):]
+        if not df.empty:
+            out.append((t, df))
+    return out
 
 def fetch_prices(tickers, days=120):
-    return fetch_prices_cached(tuple(tickers), period=f"{days}d")
+    return fetch_prices_cached(_canon_tickers(tickers), period=f"{days}d")
+
+# Verdicts de validation des symboles Yahoo (data/ticker_check.json, avec expiration)
+TICKER_CHECK_PATH = os.path.join(DATA_DIR, "ticker_check.json")
+CHECK_TTL_OK = 7*24*3600
+CHECK_TTL_BAD = 24*3600
+CHECK_RETRY = 10*60           # symbole sans réponse : pas de nouvel essai avant (RAM seulement)
+_check_idx = None
+_check_retry = {}
+_check_lock = threading.Lock()
+
+def _check_index():
+    global _check_idx
+    with _check_lock:
+        if _check_idx is None:
+            try:
+                _check_idx = json.load(open(TICKER_CHECK_PATH, "r", encoding="utf-8"))
+            except Exception:
+                _check_idx = {}
+        return _check_idx
+
+def validate_tickers(candidates):
+    """
+    Valide un lot de symboles Yahoo en une seule passe multi-tickers (via le stock
+    de prix, fenêtre de 5 jours). Renvoie {symbole: bool}. Les verdicts sont gardés
+    sur disque CHECK_TTL_OK / CHECK_TTL_BAD secondes. Un verdict négatif n'est gardé
+    que si le fournisseur a répondu pour ce symbole (cf. _download_chunk) ; sans
+    réponse avérée (coupure, 429, délai), il est renvoyé False, non écrit sur disque,
+    et n'est pas redemandé avant CHECK_RETRY secondes.
+    """
+    cands=list(_canon_tickers(candidates))
+    if not cands: return {}
+    chk=_check_index(); now=time.time()
+    out, todo = {}, []
+    for c in cands:
+        e=chk.get(c)
+        if e and now-e["ts"] < (CHECK_TTL_OK if e["ok"] else CHECK_TTL_BAD):
+            out[c]=e["ok"]
+        elif now-_check_retry.get(c, 0) < CHECK_RETRY:
+            out[c]=False
+        else:
+            todo.append(c)
+    if todo:
+        _, failed = _store_sync(todo, 5)
+        failed=set(failed)
+        idx=_store_index()
+        with _check_lock:
+            for c in todo:
+                if c in failed:
+                    out[c]=False; _check_retry[c]=now; continue
+                _check_retry.pop(c, None)
+                meta=idx.get(c) or {}
+                ok=bool(meta) and not meta.get("empty") and _ticker_history(c)["Close"].notna().any()
+                out[c]=bool(ok); chk[c]={"ok": bool(ok), "ts": now}
+            tmp=TICKER_CHECK_PATH+".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(chk, f)
+            os.replace(tmp, TICKER_CHECK_PATH)
+    return out
+
+def refresh_prices(tickers, days=240):
+    """Rafraîchissement intraday : force la mise à jour incrémentale (queue seule)."""
+    tickers=list(_canon_tickers(tickers))
+    if tickers:
+        _store_sync(tickers, days, force=True)
+    fetch_prices_cached.cache_clear()
+
+# =========================
+# PANEL (dates × tickers)
+# =========================
+class MarketPanel:
+    """
+    Cours alignés en tableaux NumPy denses : un tableau (dates × tickers) par champ
+    OHLCV, NaN là où un ticker n'a pas coté. Recherche ticker/date en O(1), découpes
+    par univers ou par horizon sans copie des lignes, conversion depuis / vers le
+    format long (Date, OHLCV, Ticker) utilisé partout ailleurs.
+    """
+    __slots__ = ("dates", "tickers", "fields", "_tix")
+
+    def __init__(self, dates, tickers, fields):
+        self.dates = pd.DatetimeIndex(dates)
+        self.tickers = list(tickers)
+        self.fields = dict(fields)
+        self._tix = {t: i for i, t in enumerate(self.tickers)}
+
+    @classmethod
+    def from_long(cls, df, fields=None):
+        if df is None or df.empty or not {"Ticker", "Date"} <= set(df.columns):
+            return cls([], [], {f: np.empty((0, 0)) for f in (fields or _OHLCV)})
+        fields = [f for f in (fields or _OHLCV) if f in df.columns]
+        di, dates = pd.factorize(pd.to_datetime(df["Date"]), sort=True)
+        ti, tickers = pd.factorize(df["Ticker"].astype(str).str.upper(), sort=True)
+        out = {}
+        for f in fields:
+            a = np.full((len(dates), len(tickers)), np.nan)
+            a[di, ti] = df[f].to_numpy(float)
+            out[f] = a
+        return cls(dates, tickers, out)
+
+    @classmethod
+    def from_parts(cls, parts, fields=None):
+        """Depuis [(ticker, DataFrame(Date, OHLCV))] (un cadre par ticker, dates uniques)."""
+        parts = [(str(t).upper(), df) for t, df in parts if df is not None and not df.empty]
+        fields = list(fields or _OHLCV)
+        if not parts:
+            return cls([], [], {f: np.empty((0, 0)) for f in fields})
+        parts.sort(key=lambda p: p[0])
+        fields = [f for f in fields if all(f in df.columns for _, df in parts)]
+        stamps = [df["Date"].to_numpy("datetime64[ns]") for _, df in parts]
+        dates = np.unique(np.concatenate(stamps))
+        out = {f: np.full((len(dates), len(parts)), np.nan) for f in fields}
+        for j, ((_, df), d) in enumerate(zip(parts, stamps)):
+            rows = dates.searchsorted(d)
+            for f in fields:
+                out[f][rows, j] = df[f].to_numpy(float)
+        return cls(dates, [t for t, _ in parts], out)
+
+    def to_long(self):
+        """Format long trié (Ticker, Date), lignes sans aucun champ renseigné retirées."""
+        nd, nt = len(self.dates), len(self.tickers)
+        if not nd or not nt:
+            return pd.DataFrame(columns=["Date", *self.fields, "Ticker"])
+        cols = {f: a.T.ravel() for f, a in self.fields.items()}
+        df = pd.DataFrame({"Date": np.tile(self.dates.to_numpy(), nt), **cols,
+                           "Ticker": np.repeat(np.array(self.tickers, dtype=object), nd)})
+        keep = ~np.all(np.isnan(np.column_stack(list(cols.values()))), axis=1)
+        return df[keep].reset_index(drop=True)
+
+    def __len__(self): return len(self.dates)
+    def __contains__(self, t): return str(t).upper() in self._tix
+    def __getitem__(self, field): return self.fields[field]
+    def __repr__(self):
+        span = f"{self.dates[0].date()}→{self.dates[-1].date()}" if len(self.dates) else "vide"
+        return f"MarketPanel({len(self.dates)} dates × {len(self.tickers)} tickers, {span})"
+
+    @property
+    def close(self): return self.fields["Close"]
+
+    def col(self, ticker):
+        """Indice de colonne d'un ticker (KeyError s'il est absent)."""
+        return self._tix[str(ticker).upper()]
+
+    def row(self, date):
+        """Indice de la dernière date <= `date` (-1 si avant le début)."""
+        return int(self.dates.searchsorted(pd.Timestamp(date), side="right")) - 1
+
+    def series(self, ticker, field="Close"):
+        return pd.Series(self.fields[field][:, self.col(ticker)], index=self.dates, name=str(ticker).upper())
+
+    def _take(self, rows=slice(None), cols=None):
+        if cols is None:
+            return MarketPanel(self.dates[rows], self.tickers, {f: a[rows] for f, a in self.fields.items()})
+        return MarketPanel(self.dates[rows], [self.tickers[i] for i in cols],
+                           {f: a[rows][:, cols] for f, a in self.fields.items()})
+
+    def select(self, tickers):
+        """Sous-univers (tickers absents ignorés, ordre demandé conservé)."""
+        cols = [self._tix[t] for t in dict.fromkeys(str(t).upper() for t in tickers) if t in self._tix]
+        return self._take(cols=np.asarray(cols, dtype=np.intp))
+
+    def since(self, start):
+        return self._take(rows=slice(int(self.dates.searchsorted(pd.Timestamp(start))), None))
+
+    def last(self, n):
+        return self._take(rows=slice(max(len(self.dates) - int(n), 0), None))
+
+    def ffill(self, field="Close"):
+        """Report du dernier cours connu vers l'avant, par colonne."""
+        a = self.fields[field]
+        if not a.size: return a.copy()
+        idx = np.where(np.isnan(a), 0, np.arange(a.shape[0])[:, None])
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        return a[idx, np.arange(a.shape[1])]
+
+    def returns(self, lag=1, field="Close"):
+        """Rendements simples sur `lag` séances (cours reportés), NaN au début."""
+        a = self.ffill(field)
+        out = np.full_like(a, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[lag:] = a[lag:] / a[:-lag] - 1.0
+        return out
+
+def fetch_panel(tickers, days=240):
+    """Même fenêtre que fetch_prices, rangée directement en MarketPanel depuis le stock."""
+    return MarketPanel.from_parts(_stored_window(list(_canon_tickers(tickers)), days))
 
 # =========================
 # VARIATIONS CALENDAIRES
 # =========================
-def _calendar_returns(last_rows: pd.DataFrame, full_df: pd.DataFrame) -> pd.DataFrame:
-    """Variations calendaire J/7j/30j (tolérant jours sans cotations)."""
+# Horizons : nom de colonne -> nb de jours calendaires, ou "ytd" (dernier cours de
+# l'année précédente). Toutes les horizons sont résolus en un seul merge_asof.
+CAL_HORIZONS = {"pct_1d": 1, "pct_7d": 7, "pct_30d": 30}
+CAL_HORIZONS_ALL = {"pct_1d": 1, "pct_7d": 7, "pct_30d": 30, "pct_90d": 90, "pct_ytd": "ytd", "pct_1y": 365}
+
+def _horizon_targets(ref, spec):
+    if spec == "ytd":
+        return pd.to_datetime((ref.dt.year - 1).astype(str) + "-12-31").astype("datetime64[ns]")
+    return ref - pd.Timedelta(days=int(spec))
+
+def _calendar_returns(last_rows: pd.DataFrame, full_df: pd.DataFrame, horizons=None) -> pd.DataFrame:
+    """
+    Variations calendaires (tolérant jours sans cotations) : pour chaque horizon,
+    dernier cours <= date de référence - horizon ; à défaut le premier cours connu
+    du ticker. Anti-split : variation sur 1 jour > 40 % ignorée.
+    """
+    horizons = horizons or CAL_HORIZONS
     if full_df.empty or last_rows.empty:
-        for k in ("pct_1d","pct_7d","pct_30d"): last_rows[k]=np.nan
+        for k in horizons: last_rows[k]=np.nan
         return last_rows
-    full=full_df.copy()
+    full=full_df[["Ticker","Date","Close"]].copy()
     full["Ticker"]=full["Ticker"].astype(str).str.upper()
+    full["Date"]=pd.to_datetime(full["Date"]).astype("datetime64[ns]")
     full=full.sort_values(["Ticker","Date"])
     last=last_rows.copy()
     last["Ticker"]=last["Ticker"].astype(str).str.upper()
 
-    def lookup_price(tkr, ref_date, days_back):
-        target=pd.to_datetime(ref_date)-pd.Timedelta(days=days_back)
-        hist=full[full["Ticker"]==tkr][["Date","Close"]].dropna().sort_values("Date")
-        if hist.empty: return np.nan
-        hist=hist[hist["Date"]<=target]
-        if hist.empty:
-            return float(full[full["Ticker"]==tkr]["Close"].iloc[0])
-        return float(hist["Close"].iloc[-1])
-
-    vals_1, vals_7, vals_30 = [], [], []
-    for _, r in last.iterrows():
-        tkr, dref, pref = r["Ticker"], r["Date"], float(r["Close"])
-        p1, p7, p30 = lookup_price(tkr, dref, 1), lookup_price(tkr, dref, 7), lookup_price(tkr, dref, 30)
-        v1  = (pref/p1-1)  if (np.isfinite(pref) and np.isfinite(p1)  and p1>0)  else np.nan
-        v7  = (pref/p7-1)  if (np.isfinite(pref) and np.isfinite(p7)  and p7>0)  else np.nan
-        v30 = (pref/p30-1) if (np.isfinite(pref) and np.isfinite(p30) and p30>0) else np.nan
-        if np.isfinite(v1) and abs(v1)>0.4: v1=np.nan    # anti-split extrême
-        vals_1.append(v1); vals_7.append(v7); vals_30.append(v30)
-    last["pct_1d"], last["pct_7d"], last["pct_30d"] = vals_1, vals_7, vals_30
+    # repli : premier cours (même NaN) des tickers ayant au moins un cours valide
+    valid=full.dropna(subset=["Close"])
+    first=full.drop_duplicates("Ticker", keep="first").set_index("Ticker")["Close"]
+    first=first[first.index.isin(valid["Ticker"].unique())]
+    fallback=last["Ticker"].map(first).to_numpy(dtype=float)
+    has_hist=last["Ticker"].isin(first.index).to_numpy()
+
+    ref=pd.to_datetime(last["Date"]).astype("datetime64[ns]").reset_index(drop=True)
+    n=len(last)
+    left=pd.concat([
+        pd.DataFrame({"_when": _horizon_targets(ref, spec), "Ticker": last["Ticker"].to_numpy(),
+                      "_h": h, "_row": np.arange(n)})
+        for h, spec in enumerate(horizons.values())
+    ], ignore_index=True).sort_values("_when", kind="stable")
+    right=valid.rename(columns={"Date":"_when","Close":"_px"}).sort_values("_when", kind="stable")
+    m=pd.merge_asof(left, right, on="_when", by="Ticker", direction="backward")
+
+    px=np.full((len(horizons), n), np.nan)
+    px[m["_h"].to_numpy(), m["_row"].to_numpy()]=m["_px"].to_numpy(dtype=float)
+    px=np.where(np.isnan(px), fallback, px)
+    px[:, ~has_hist]=np.nan
+
+    pref=last["Close"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ok=np.isfinite(pref) & np.isfinite(px) & (px>0)
+        var=np.where(ok, pref/px-1, np.nan)
+    for h, (k, spec) in enumerate(horizons.items()):
+        v=var[h]
+        if spec == 1:
+            v=np.where(np.abs(v)>0.4, np.nan, v)    # anti-split extrême
+        last[k]=v
     return last
 
 # =========================
 # MÉTRIQUES (MA20/50/120/240 + trend)
 # =========================
-def compute_metrics(df: pd.DataFrame) -> pd.DataFrame:
+# Moteur vectorisé : lignes triées (Ticker, Date), groupes contigus, fenêtres
+# glissantes par sommes cumulées bornées au début du groupe. NaN ignorés comme
+# pandas rolling(window, min_periods).mean().
+def _group_starts(keys):
+    """Pour chaque ligne, l'indice de la première ligne de son groupe (clés triées)."""
+    keys=np.asarray(keys)
+    n=len(keys)
+    if n==0: return np.zeros(0, dtype=np.int64)
+    new=np.ones(n, dtype=bool)
+    new[1:]=keys[1:]!=keys[:-1]
+    first=np.flatnonzero(new)
+    return first[np.cumsum(new)-1]
+
+def _rolling_mean_grouped(values, gstart, window, min_periods):
+    """
+    Moyenne glissante par groupe (sommes cumulées). Les valeurs sont centrées sur
+    la moyenne de leur groupe et la somme repart de zéro à chaque groupe : les
+    différences cs[i+1]-cs[lo] restent petites, quelle que soit la taille de l'univers.
+    """
+    v=np.asarray(values, dtype=float)
+    ok=~np.isnan(v)
+    gid=np.cumsum(np.append(True, gstart[1:]!=gstart[:-1]))-1 if len(v) else np.zeros(0, dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        center=np.nan_to_num(np.bincount(gid, np.where(ok, v, 0.0))/np.bincount(gid, ok))[gid]
+    c=np.where(ok, v-center, 0.0)
+    cs=np.cumsum(c)
+    cs=np.concatenate(([0.0], cs-(cs[gstart]-c[gstart])))       # remise à zéro par groupe
+    cn=np.concatenate(([0], np.cumsum(ok)))
+    i=np.arange(len(v))
+    lo=np.maximum(i-window+1, gstart)
+    s=cs[i+1]-np.where(lo==gstart, 0.0, cs[lo]); n=cn[i+1]-cn[lo]
+    out=np.full(len(v), np.nan)
+    m=n>=min_periods
+    out[m]=s[m]/n[m]+center[m]
+    return out
+
+def _shift_grouped(values, gstart):
+    v=np.asarray(values, dtype=float)
+    out=np.empty_like(v)
+    if len(v)==0: return out
+    out[1:]=v[:-1]; out[0]=np.nan
+    out[np.arange(len(v))==gstart]=np.nan
+    return out
+
+def compute_metrics(df: pd.DataFrame, horizons=None) -> pd.DataFrame:
     """
     Retourne 1 ligne par ticker avec :
     - Close, ATR14
     - MA20/50 (ST), MA120/240 (LT)
     - Gaps MA, trend scores ST & LT
-    - pct_1d / pct_7d / pct_30d
+    - pct_1d / pct_7d / pct_30d (ou les colonnes de `horizons`, cf. CAL_HORIZONS_ALL)
     """
+    horizons = horizons or CAL_HORIZONS
     cols=["Ticker","Date","Close","ATR14",
           "MA20","MA50","MA120","MA240",
           "gap20","gap50","gap120","gap240",
-          "trend_score","lt_trend_score",
-          "pct_1d","pct_7d","pct_30d"]
+          "trend_score","lt_trend_score"]+list(horizons)
     if df is None or df.empty: return pd.DataFrame(columns=cols)
     df=df.copy()
     if "Date" not in df.columns:
@@ -351,74 +1435,363 @@ def compute_metrics(df: pd.DataFrame) -> pd.DataFrame:
 
     df["Ticker"]=df["Ticker"].astype(str).str.upper()
     df=df.sort_values(["Ticker","Date"])
-    df["PrevClose"]=df.groupby("Ticker")["Close"].shift(1)
+    gstart=_group_starts(df["Ticker"].to_numpy())
+    close=df["Close"].to_numpy(dtype=float)
+    high=df["High"].to_numpy(dtype=float); low=df["Low"].to_numpy(dtype=float)
+    prev=_shift_grouped(close, gstart)
 
     # TR & ATR
-    tr1 = df["High"] - df["Low"]
-    tr2 = (df["High"] - df["PrevClose"]).abs()
-    tr3 = (df["Low"]  - df["PrevClose"]).abs()
-    df["TR"] = np.nanmax(np.vstack([tr1.values, tr2.values, tr3.values]), axis=0)
-    df["ATR14"]=df.groupby("Ticker")["TR"].transform(lambda s:s.rolling(14,min_periods=5).mean())
+    with np.errstate(invalid="ignore"):
+        tr=np.fmax(np.fmax(high-low, np.abs(high-prev)), np.abs(low-prev))
+    ind={"ATR14": _rolling_mean_grouped(tr, gstart, 14, 5)}
 
     # MAs
-    df["MA20"]  = df.groupby("Ticker")["Close"].transform(lambda s:s.rolling(20,  min_periods=5).mean())
-    df["MA50"]  = df.groupby("Ticker")["Close"].transform(lambda s:s.rolling(50,  min_periods=10).mean())
-    df["MA120"] = df.groupby("Ticker")["Close"].transform(lambda s:s.rolling(120, min_periods=20).mean())
-    df["MA240"] = df.groupby("Ticker")["Close"].transform(lambda s:s.rolling(240, min_periods=30).mean())
-
-    last=df.groupby("Ticker").tail(1)[["Ticker","Date","Close","ATR14","MA20","MA50","MA120","MA240"]].copy()
-
-    # Gaps vectorisés
-    def _gap(a, b):
-        a=np.asarray(a, float); b=np.asarray(b, float)
-        mask = np.isfinite(a) & np.isfinite(b) & (b!=0)
-        out = np.full_like(a, np.nan, dtype=float)
-        out[mask] = a[mask]/b[mask] - 1.0
-        return out
+    for name, w, mp in (("MA20",20,5), ("MA50",50,10), ("MA120",120,20), ("MA240",240,30)):
+        ind[name]=_rolling_mean_grouped(close, gstart, w, mp)
+
+    # dernière ligne de chaque ticker
+    end=np.flatnonzero(np.append(gstart[1:]!=gstart[:-1], True)) if len(df) else np.zeros(0, dtype=np.int64)
+    last=df.iloc[end][["Ticker","Date","Close"]].copy()
+    for name, arr in ind.items():
+        last[name]=arr[end]
+
+    _add_trend_columns(last)
+
+    # Variations calendaire
+    last = _calendar_returns(last, df, horizons)
 
+    return last.reset_index(drop=True)
+
+def _gap(a, b):
+    a=np.asarray(a, float); b=np.asarray(b, float)
+    mask = np.isfinite(a) & np.isfinite(b) & (b!=0)
+    out = np.full_like(a, np.nan, dtype=float)
+    out[mask] = a[mask]/b[mask] - 1.0
+    return out
+
+def _add_trend_columns(last):
+    """Gaps Close/MA et trend scores ST & LT (en place)."""
     last["gap20"]  = _gap(last["Close"], last["MA20"])
     last["gap50"]  = _gap(last["Close"], last["MA50"])
     last["gap120"] = _gap(last["Close"], last["MA120"])
     last["gap240"] = _gap(last["Close"], last["MA240"])
-
-    # Trend scores
     last["trend_score"]    = 0.6*last["gap20"]  + 0.4*last["gap50"]
     last["lt_trend_score"] = 0.6*last["gap120"] + 0.4*last["gap240"]
+    return last
 
-    # Variations calendaire
-    last = _calendar_returns(last, df)
+# =========================
+# INDICATEURS INCRÉMENTAUX (streaming)
+# =========================
+_INDICATOR_WINDOWS = {"ATR14": (14, 5), "MA20": (20, 5), "MA50": (50, 10), "MA120": (120, 20), "MA240": (240, 30)}
+_NO_EVICT = object()
+
+class _Roll:
+    """Fenêtre glissante : somme et nb de valeurs non-NaN, resynchronisée toutes les `w` poussées."""
+    __slots__ = ("w", "mp", "q", "s", "n", "k")
+
+    def __init__(self, w, mp, values=()):
+        self.w, self.mp, self.k = w, mp, 0
+        self.q = deque(values[-w:], maxlen=w)
+        self._resync()
+
+    def _resync(self):
+        a = np.fromiter(self.q, float, len(self.q))
+        ok = ~np.isnan(a)
+        self.s, self.n = float(a[ok].sum()), int(ok.sum())
+
+    def push(self, v):
+        out = self.q[0] if len(self.q) == self.w else _NO_EVICT
+        self.q.append(v)
+        if out is not _NO_EVICT and out == out: self.s -= out; self.n -= 1
+        if v == v: self.s += v; self.n += 1
+        self.k += 1
+        if self.k >= self.w:
+            self.k = 0; self._resync()
+        return out
 
-    return last.reset_index(drop=True)
+    def undo(self, out):
+        v = self.q.pop()
+        if v == v: self.s -= v; self.n -= 1
+        if out is not _NO_EVICT:
+            self.q.appendleft(out)
+            if out == out: self.s += out; self.n += 1
+
+    def mean(self):
+        return self.s / self.n if self.n >= self.mp else np.nan
+
+class _TickerState:
+    __slots__ = ("rolls", "evicted", "date", "close", "saved", "cal_d", "cal_c", "first", "n")
+
+    def __init__(self):
+        self.rolls = {k: _Roll(w, mp) for k, (w, mp) in _INDICATOR_WINDOWS.items()}
+        self.evicted, self.saved = None, None
+        self.n = 0                            # barres vues, dernière comprise
+        self.date, self.close = None, np.nan
+        self.cal_d, self.cal_c = [], []       # clôtures valides (dates croissantes)
+        self.first = None                     # premier cours vu (repli des variations)
+
+    def push(self, d, high, low, close):
+        prev = self.close
+        with np.errstate(invalid="ignore"):
+            tr = np.fmax(np.fmax(high - low, abs(high - prev)), abs(low - prev))
+        vals = {"ATR14": tr, "MA20": close, "MA50": close, "MA120": close, "MA240": close}
+        self.saved = (self.date, self.close, self.first)
+        self.evicted = {k: r.push(float(vals[k])) for k, r in self.rolls.items()}
+        self.date, self.close = d, close
+        self.n += 1
+        if self.first is None: self.first = close
+        if close == close:
+            self.cal_d.append(d); self.cal_c.append(close)
+
+    def seed(self, dates, high, low, close):
+        """Initialise l'état depuis un historique (tableaux triés par date)."""
+        prev = np.r_[np.nan, close[:-1]]
+        with np.errstate(invalid="ignore"):
+            tr = np.fmax(np.fmax(high - low, np.abs(high - prev)), np.abs(low - prev))
+        for k, (w, mp) in _INDICATOR_WINDOWS.items():
+            self.rolls[k] = _Roll(w, mp, (tr if k == "ATR14" else close)[:-1].tolist())
+        if len(dates) > 1:
+            self.date, self.close, self.first = dates[-2], close[-2], close[0]
+        self.n = len(dates) - 1
+        ok = ~np.isnan(close[:-1])
+        self.cal_d, self.cal_c = list(dates[:-1][ok]), close[:-1][ok].tolist()
+        self.push(dates[-1], high[-1], low[-1], close[-1])
+
+    def rollback(self):
+        """Annule la dernière barre (barre intraday remplacée par sa version à jour)."""
+        for k, r in self.rolls.items():
+            r.undo(self.evicted[k])
+        if self.cal_d and self.cal_d[-1] == self.date:
+            self.cal_d.pop(); self.cal_c.pop()
+        self.date, self.close, self.first = self.saved
+        self.n -= 1
+        self.evicted = self.saved = None
+
+    def trim(self, keep_days):
+        i = bisect.bisect_right(self.cal_d, self.date - pd.Timedelta(days=keep_days)) - 1
+        if i > 256:
+            del self.cal_d[:i]; del self.cal_c[:i]
+
+    def price_at(self, target):
+        if not self.cal_d: return np.nan
+        i = bisect.bisect_right(self.cal_d, target) - 1
+        return self.cal_c[i] if i >= 0 else self.first
+
+class IndicatorState:
+    """
+    État incrémental des indicateurs par ticker : fenêtres MA20/50/120/240 et ATR14
+    (sommes glissantes + tampons), dernière clôture et clôtures récentes pour les
+    variations calendaires. update(bars) avance chaque série en O(1) par ticker —
+    une barre de même date que la dernière la remplace (rafraîchissement intraday) —
+    et renvoie le même cadre "dernière ligne" que compute_metrics.
+    """
+
+    def __init__(self, history=None, horizons=None):
+        self.horizons = horizons or CAL_HORIZONS
+        days = [h for h in self.horizons.values() if h != "ytd"]
+        self.keep_days = max(days + ([366] if "ytd" in self.horizons.values() else [])) + 7
+        self.states = {}
+        if history is not None and not history.empty:
+            self.seed(history)
+
+    def seed(self, df):
+        """(Ré)initialise l'état depuis un historique long (Ticker, Date, High, Low, Close)."""
+        df = df[["Ticker", "Date", "High", "Low", "Close"]].copy()
+        df["Ticker"] = df["Ticker"].astype(str).str.upper()
+        df["Date"] = pd.to_datetime(df["Date"])
+        df = df.sort_values(["Ticker", "Date"])
+        keys = df["Ticker"].to_numpy()
+        dates = list(df["Date"])
+        high, low, close = (df[c].to_numpy(float) for c in ("High", "Low", "Close"))
+        bounds = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True])
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            st = self.states[keys[a]] = _TickerState()
+            d = np.empty(b - a, dtype=object); d[:] = dates[a:b]
+            st.seed(d, high[a:b], low[a:b], close[a:b])
+            st.trim(self.keep_days)
+        return self.snapshot()
+
+    def update(self, bars):
+        if bars is not None and not bars.empty:
+            b = bars[["Ticker", "Date", "High", "Low", "Close"]].copy()
+            b["Ticker"] = b["Ticker"].astype(str).str.upper()
+            b["Date"] = pd.to_datetime(b["Date"])
+            b = b.sort_values(["Ticker", "Date"])
+            for t, d, h, l, c in zip(b["Ticker"], b["Date"], b["High"].to_numpy(float),
+                                     b["Low"].to_numpy(float), b["Close"].to_numpy(float)):
+                st = self.states.get(t)
+                if st is None:
+                    st = self.states[t] = _TickerState()
+                if st.date is not None:
+                    if d < st.date: continue
+                    if d == st.date: st.rollback()
+                st.push(d, h, l, c)
+                st.trim(self.keep_days)
+        return self.snapshot()
+
+    def sync(self, df):
+        """
+        Aligne l'état sur l'historique long `df` (celui que recevrait compute_metrics)
+        et renvoie snapshot(). Un ticker connu dont les barres antérieures à sa
+        dernière date sont inchangées (nombre et dernière clôture) n'avance que des
+        barres >= cette date ; les autres (nouveaux, ré-ajustés, fenêtre décalée d'un
+        jour) sont ré-initialisés, et les tickers absents de `df` oubliés.
+        """
+        if df is None or df.empty:
+            self.states = {}
+            return self.snapshot()
+        df = df[["Ticker", "Date", "High", "Low", "Close"]].copy()
+        df["Ticker"] = df["Ticker"].astype(str).str.upper()
+        df["Date"] = pd.to_datetime(df["Date"]).astype("datetime64[ns]")
+        df = df.sort_values(["Ticker", "Date"], kind="stable")
+        last = pd.to_datetime(df["Ticker"].map({t: st.date for t, st in self.states.items()}))
+        before = (df["Date"] < last).to_numpy()
+        tail = df[~before & last.notna().to_numpy()]
+        head = df[before]
+        cnt = head["Ticker"].value_counts()
+        prev = head.drop_duplicates("Ticker", keep="last").set_index("Ticker")["Close"]
+        present = set(tail["Ticker"])
+
+        def _same(t, st):
+            p, q = prev.get(t, np.nan), (st.saved[1] if st.saved else np.nan)
+            return (t in present and cnt.get(t, 0) == st.n - 1
+                    and (p == q or (p != p and q != q)))
+
+        tickers = set(df["Ticker"])
+        self.states = {t: st for t, st in self.states.items() if t in tickers and _same(t, st)}
+        reseed = tickers - set(self.states)
+        if reseed:
+            self.seed(df[df["Ticker"].isin(reseed)])
+        return self.update(tail[~tail["Ticker"].isin(reseed)])
+
+    def snapshot(self):
+        tickers = sorted(self.states)
+        cols = ["Ticker","Date","Close"] + list(_INDICATOR_WINDOWS)
+        last = pd.DataFrame([[t, self.states[t].date, self.states[t].close]
+                             + [r.mean() for r in self.states[t].rolls.values()] for t in tickers],
+                            columns=cols)
+        last = last[["Ticker","Date","Close","ATR14","MA20","MA50","MA120","MA240"]]
+        _add_trend_columns(last)
+        for k, spec in self.horizons.items():
+            vals = []
+            for t in tickers:
+                st = self.states[t]
+                if not st.cal_d or st.date is None:
+                    vals.append(np.nan); continue
+                ref = pd.Timestamp(st.date)
+                target = pd.Timestamp(ref.year - 1, 12, 31) if spec == "ytd" else ref - pd.Timedelta(days=int(spec))
+                p, pref = st.price_at(target), st.close
+                v = pref / p - 1 if (np.isfinite(pref) and np.isfinite(p) and p > 0) else np.nan
+                if spec == 1 and np.isfinite(v) and abs(v) > 0.4: v = np.nan   # anti-split extrême
+                vals.append(v)
+            last[k] = vals
+        return last
+
+# Un IndicatorState par univers (fetch_all_markets) : recalcul complet une fois par
+# jour (la fenêtre de fetch_prices glisse), puis mises à jour O(1) par ticker.
+INDICATOR_STATES_MAX = 8
+_indicator_states = OrderedDict()
+_indicator_lock = threading.Lock()
+
+def universe_metrics(key, px):
+    """compute_metrics(px) servi par l'IndicatorState gardé pour l'univers `key`."""
+    with _indicator_lock:
+        st = _indicator_states.pop(key, None) or IndicatorState()
+        _indicator_states[key] = st
+        while len(_indicator_states) > INDICATOR_STATES_MAX:
+            _indicator_states.popitem(last=False)
+        return st.sync(px)
 
 # =========================
 # INFOS SOCIÉTÉ & DIVIDENDES
 # =========================
-@lru_cache(maxsize=1024)
-def company_name_from_ticker(ticker: str) -> str:
-    if not ticker: return ""
+# Résolution des noms par lot, dans l'ordre : membres d'indices (instantanés),
+# index persistant data/names.json, puis requêtes concurrentes pour le reste.
+NAMES_PATH = os.path.join(DATA_DIR, "names.json")
+NAME_WORKERS = 8
+NAME_MISS_TTL = 24*3600       # un ticker sans nom chez Yahoo n'est pas re-demandé avant
+_names_idx = None
+_names_miss = {}              # ticker -> epoch de la dernière recherche infructueuse
+_names_lock = threading.Lock()
+_members_names_memo = (None, {})
+
+def _names_index():
+    global _names_idx
+    with _names_lock:
+        if _names_idx is None:
+            try:
+                _names_idx = json.load(open(NAMES_PATH, "r", encoding="utf-8"))
+            except Exception:
+                _names_idx = {}
+        return _names_idx
+
+def _members_names():
+    """Noms issus des instantanés de membres déjà disponibles (jamais de réseau)."""
+    global _members_names_memo
+    snaps = []
+    for index_name in _MEMBERS_BUILDERS:
+        snap = _members_mem.get(index_name)
+        if snap is None:
+            snap = _members_load(index_name)
+            if snap is not None:
+                _members_mem[index_name] = snap
+        if snap is not None:
+            snaps.append((index_name, snap))
+    key = tuple((name, snap[1]) for name, snap in snaps)
+    if _members_names_memo[0] == key:
+        return _members_names_memo[1]
+    out = {}
+    for _, (df, _) in snaps:
+        out.update(zip(df["ticker"].astype(str).str.upper(), df["name"].astype(str)))
+    _members_names_memo = (key, out)
+    return out
+
+def _lookup_name(ticker):
     try:
-        t = yf.Ticker(ticker)
-        name = None
-        try:
-            name = t.fast_info.get("shortName", None)
-        except Exception:
-            pass
-        if not name:
-            info = t.get_info()
-            name = info.get("shortName") or info.get("longName")
-        return name or ticker
+        return get_provider().company_name(ticker)
     except Exception:
-        return ticker
+        return None
+
+def company_names(tickers):
+    """{ticker: nom} pour tout un lot ; à défaut de nom trouvé, le ticker lui-même."""
+    tickers = [t for t in dict.fromkeys(str(x).strip().upper() for x in tickers if isinstance(x, str)) if t]
+    if not tickers: return {}
+    mem = _members_names()
+    out = {t: mem[t] for t in tickers if mem.get(t)}
+    rest = [t for t in tickers if t not in out]
+    if rest:
+        idx = _names_index()
+        out.update({t: idx[t] for t in rest if idx.get(t)})
+        now = time.time()
+        rest = [t for t in rest if t not in out and now - _names_miss.get(t, 0) >= NAME_MISS_TTL]
+    if rest:
+        with ThreadPoolExecutor(max_workers=min(NAME_WORKERS, len(rest))) as pool:
+            found = {t: n for t, n in zip(rest, pool.map(_lookup_name, rest)) if n}
+        with _names_lock:
+            now = time.time()
+            _names_miss.update({t: now for t in rest if t not in found})
+            if found:
+                idx.update(found)
+                tmp = NAMES_PATH + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(idx, f, ensure_ascii=False, indent=1)
+                os.replace(tmp, NAMES_PATH)
+        out.update(found)
+    return {t: out.get(t) or t for t in tickers}
+
+@ttl_cache(ttl=7*24*3600, max_bytes=4*2**20)
+@single_flight
+def company_name_from_ticker(ticker: str) -> str:
+    if not ticker: return ""
+    return company_names([ticker]).get(str(ticker).strip().upper()) or ticker
 
 def dividends_summary(ticker: str):
     try:
-        t = yf.Ticker(ticker)
-        div = t.dividends
+        div, px = get_provider().dividends(ticker)
         if div is None or div.empty:
             return [], None
         div = div.sort_index(ascending=False)
         recent = [(str(idx.date()), float(val)) for idx, val in div.head(8).items()]
-        px = t.history(period="5d")["Close"].iloc[-1]
         trailing = float(div.head(4).sum()/px) if px and px>0 else None
         return recent, trailing
     except Exception:
@@ -427,11 +1800,12 @@ def dividends_summary(ticker: str):
 # =========================
 # NEWS (avec dates) & RÉSUMÉ
 # =========================
-@lru_cache(maxsize=256)
+@ttl_cache(ttl=30*60, max_bytes=16*2**20)
+@single_flight
 def google_news_titles(query, lang="fr"):
     url = f"https://news.google.com/rss/search?q={requests.utils.quote(query)}&hl={lang}-{lang.upper()}&gl={lang.upper()}&ceid={lang.upper()}:{lang.upper()}"
     try:
-        xml = requests.get(url, headers=UA, timeout=12).text
+        xml = get_provider().http_get(url, timeout=12)
         import xml.etree.ElementTree as ET
         root = ET.fromstring(xml)
         items = []
@@ -485,6 +1859,19 @@ def news_summary(name, ticker, lang="fr"):
 # =========================
 # DÉCISIONS IA & NIVEAUX (STRICT)
 # =========================
+def _num(frame, col):
+    if col not in frame.columns: return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=float)
+
+def round_exact(values, nd=2):
+    """
+    round() Python élément par élément (arrondi décimal exact, NaN conservés),
+    là où np.round / Series.round décalent les demi-centimes.
+    """
+    a=np.asarray(values, dtype=float)
+    out=np.array([round(x, nd) for x in a.ravel().tolist()], dtype=float).reshape(a.shape)
+    return pd.Series(out, index=values.index, name=values.name) if isinstance(values, pd.Series) else out
+
 def price_levels_from_row(row, profile="Neutre"):
     p=get_profile_params(profile)
     px=float(row.get("Close", math.nan))
@@ -497,6 +1884,28 @@ def price_levels_from_row(row, profile="Neutre"):
         "stop":   round(base*p["stop_mult"],2),
     }
 
+def profile_levels(frame, profiles=None):
+    """
+    Niveaux entry/target/stop de plusieurs profils en une passe : la base (MA20,
+    sinon Close) est diffusée contre les multiplicateurs (profils × lignes).
+    Renvoie {profil: DataFrame entry/target/stop aligné sur frame.index}.
+    """
+    profiles=list(profiles or PROFILE_PARAMS)
+    px, ma20 = _num(frame, "Close"), _num(frame, "MA20")
+    base=np.where(np.isfinite(ma20), ma20, px)
+    base=np.where(np.isfinite(base), base, np.nan)
+    out={p: {} for p in profiles}
+    for k in ("entry","target","stop"):
+        mult=np.array([get_profile_params(p)[f"{k}_mult"] for p in profiles])
+        # round() Python (arrondi décimal exact) : mêmes centimes que price_levels_from_row
+        lev=round_exact(mult[:, None]*base[None, :], 2)
+        for i, p in enumerate(profiles): out[p][k]=lev[i]
+    return {p: pd.DataFrame(cols, index=frame.index) for p, cols in out.items()}
+
+def price_levels(frame, profile="Neutre"):
+    """price_levels_from_row sur tout un cadre : colonnes entry/target/stop (base MA20, sinon Close)."""
+    return profile_levels(frame, [profile])[profile]
+
 def decision_label_strict(row, profile="Neutre", held=False):
     """
     IA stricte :
@@ -550,6 +1959,52 @@ def decision_label_strict(row, profile="Neutre", held=False):
 
     return "🟢 Acheter"
 
+_VOL_FACTOR = {"Prudent": 0.9, "Agressif": 1.2}
+
+def _rule_masks(px, ma20, ma50, ma120, ma240, atr, m7, m30):
+    """Conditions de decision_label_strict hors profil, sur des tableaux de même forme."""
+    fin=np.isfinite
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ct_ok=fin(ma20) & (px>=ma20) & fin(ma50) & (px>=ma50)
+        lt_ok=fin(ma120) & fin(ma240) & (ma120>=ma240) & (px>=ma120)
+        vol=np.where(fin(atr) & (px>0), atr/px, 0.03)
+    mix=0.6*np.where(fin(m7), m7, 0)+0.4*np.where(fin(m30), m30, 0)
+    mom_ok=~(fin(m7) | fin(m30)) | (mix>=-0.01)
+    return ct_ok, lt_ok, vol, mom_ok
+
+def decide_profiles(frame, profiles=None, held=False):
+    """
+    decision_label_strict pour plusieurs profils d'un coup : les conditions ST/LT/
+    momentum sont communes, seuls les seuils de volatilité sont diffusés
+    (profils × lignes). Renvoie un DataFrame de libellés, une colonne par profil.
+    """
+    profiles=list(profiles or PROFILE_PARAMS)
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=profiles, index=getattr(frame, "index", None), dtype=object)
+    vol_max=np.array([get_profile_params(p)["vol_max"] for p in profiles])[:, None]
+    factor=np.array([_VOL_FACTOR.get(p, 1.0) for p in profiles])[:, None]
+    px, ma20, ma50, ma120, ma240, atr, m7, m30 = (_num(frame, c) for c in
+        ("Close","MA20","MA50","MA120","MA240","ATR14","pct_7d","pct_30d"))
+    ct_ok, lt_ok, vol, mom_ok = _rule_masks(px, ma20, ma50, ma120, ma240, atr, m7, m30)
+    vol_ok=vol<=vol_max*factor
+
+    held=np.broadcast_to(np.asarray(held, dtype=bool), px.shape)
+    sell=np.isfinite(px) & held & ~lt_ok & (vol>vol_max*1.2)
+    buy=np.isfinite(px) & ct_ok & lt_ok & vol_ok & mom_ok
+    labels=np.select([sell, buy], ["🔴 Vendre", "🟢 Acheter"], "👁️ Surveiller")
+    return pd.DataFrame({p: labels[i] for i, p in enumerate(profiles)}, index=frame.index)
+
+def decide(frame, profile=None, held=False):
+    """
+    decision_label_strict sur tout un cadre d'un coup (mêmes règles, conditions
+    calculées en tableaux booléens). Profil sauvegardé lu une seule fois si
+    `profile` est None. `held` : booléen ou masque par ligne. Renvoie une Series
+    de libellés alignée sur frame.index.
+    """
+    if profile is None: profile = load_profile()
+    if frame is None or frame.empty: return pd.Series([], index=getattr(frame, "index", None), dtype=object)
+    return decide_profiles(frame, [profile], held)[profile]
+
 # Compat : anciennes fonctions pages
 def decision_label_from_row(row, held=False, vol_max=0.05):
     # On utilise le profil sauvegardé pour rester cohérent entre pages
@@ -560,6 +2015,66 @@ def decision_label_combined(row, held=False, vol_max=0.05):
     profile = load_profile()
     return decision_label_strict(row, profile=profile, held=held)
 
+# =========================
+# ENRICHISSEMENT (pages Indices / Portefeuille / Recherche)
+# =========================
+def enrich(metrics, profile=None, held=False):
+    """
+    Ajoute d'un coup, sur tout le cadre de compute_metrics :
+    - Décision IA, Entrée / Objectif / Stop (€)
+    - Proximité (%) du cours à l'entrée et son Signal (🟢 ≤2 %, ⚠️ ≤5 %, 🔴 au-delà, ⚪ inconnu)
+    - Tendance LT (🌱 MA120>MA240, 🌧 <, ⚖️ sinon) et Score IA (0-100, écarts MA20/50 + MA120/240)
+    - si `held` : Perf% (si PRU) et 🎯 Priorité (Vendre / Alléger / Couper / Conserver)
+    Profil sauvegardé lu une fois si `profile` est None. Tous les profils sont
+    calculés ensemble et gardés par empreinte du cadre : changer de profil n'est
+    qu'une lecture.
+    """
+    if profile is None: profile = load_profile()
+    if metrics.empty: return metrics.copy()
+    out = _enrich_all(metrics, bool(held)).get(profile)
+    if out is None:   # profil inconnu -> paramètres Neutre, comme get_profile_params
+        out = _enrich_all(metrics, bool(held), (profile,))[profile]
+    return out.copy()
+
+@ttl_cache(ttl=PRICE_MEM_TTL, max_bytes=16*2**20, maxsize=16, key=_frame_key)
+def _enrich_all(metrics, held, profiles=tuple(PROFILE_PARAMS)):
+    px, ma20, ma50, ma120, ma240 = (_num(metrics, c) for c in ("Close", "MA20", "MA50", "MA120", "MA240"))
+    fin = np.isfinite
+    levels = profile_levels(metrics, profiles)
+    labels = decide_profiles(metrics, profiles, held)
+
+    # Colonnes communes à tous les profils
+    lt_known = fin(ma120) & fin(ma240)
+    lt_icon = np.select([lt_known & (ma120 > ma240), lt_known & (ma120 < ma240)], ["🌱", "🌧"], "⚖️")
+    gaps = np.abs(ma20 - ma50) + np.abs(ma120 - ma240)
+    score = round_exact(100 - np.minimum(gaps * 10, 100), 1)
+    if held:
+        pru = _num(metrics, "PRU")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            perf = np.where(fin(px) & fin(pru) & (pru > 0), (px / pru - 1) * 100, np.nan)
+
+    res = {}
+    for p in profiles:
+        out = metrics.copy()
+        entry, target, stop = (levels[p][k].to_numpy() for k in ("entry", "target", "stop"))
+        out["Décision IA"] = labels[p]
+        out["Entrée (€)"], out["Objectif (€)"], out["Stop (€)"] = entry, target, stop
+        with np.errstate(divide="ignore", invalid="ignore"):
+            prox = np.where(fin(px) & fin(entry) & (entry > 0), (px / entry - 1) * 100, np.nan)
+        out["Proximité (%)"] = round_exact(prox, 2)
+        out["Signal"] = np.select([~fin(prox), np.abs(prox) <= 2, np.abs(prox) <= 5], ["⚪", "🟢", "⚠️"], "🔴")
+        out["Tendance LT"] = lt_icon
+        out["Score IA"] = score
+        if held:
+            if "PRU" in out.columns: out["Perf%"] = round_exact(perf, 2)
+            out["🎯 Priorité"] = np.select(
+                [fin(px) & fin(target) & (px >= target),
+                 fin(perf) & (perf > 12) & (lt_icon != "🌱"),
+                 fin(px) & fin(stop) & (px <= stop)],
+                ["🎯 Vendre", "⚖️ Alléger", "🚨 Couper"], "✅ Conserver")
+        res[p] = out
+    return res
+
 # =========================
 # STYLE TABLEAUX (couleurs)
 # =========================
@@ -590,40 +2105,113 @@ def highlight_near_entry_adaptive(row):
 # =========================
 # AGGRÉGATION MARCHÉS (CAC40 / DAX / NASDAQ100 / S&P500 / LS)
 # =========================
+def _market_members(idx):
+    if idx in ("CAC 40", "DAX", "NASDAQ 100", "S&P 500"):
+        return members(idx)
+    if idx=="LS Exchange":
+        # Watchlist perso, convertie en Yahoo via mapping/heuristique
+        raw = load_watchlist_ls()
+        tickers=[maybe_guess_yahoo(x) or x for x in raw] if raw else []
+        return pd.DataFrame({"ticker": tickers, "name": raw})
+    return None
+
 def fetch_all_markets(markets, days_hist=240):
     """
     markets: liste de tuples (Indice, source) – source ignorée
     Supporte: "CAC 40", "DAX", "NASDAQ 100", "S&P 500", "LS Exchange"
+    Les membres sont chargés en parallèle puis l'univers complet part en un seul
+    fetch_prices (chunks concurrents, toutes places confondues).
     """
-    frames=[]
-    for idx, _ in markets:
-        if idx=="CAC 40":
-            mem=members("CAC 40")
-        elif idx=="DAX":
-            mem=members("DAX")
-        elif idx=="NASDAQ 100":
-            mem=members("NASDAQ 100")
-        elif idx=="S&P 500":
-            mem=members("S&P 500")
-        elif idx=="LS Exchange":
-            # Watchlist perso, convertie en Yahoo via mapping/heuristique
-            raw = load_watchlist_ls()
-            tickers=[maybe_guess_yahoo(x) or x for x in raw] if raw else []
-            mem=pd.DataFrame({"ticker": tickers, "name": raw})
-        else:
-            continue
-
-        if mem.empty: continue
+    names=[idx for idx, _ in markets]
+    if not names: return pd.DataFrame()
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        mems=list(pool.map(_market_members, names))
+    mems=[(idx, mem) for idx, mem in zip(names, mems) if mem is not None and not mem.empty]
+    if not mems: return pd.DataFrame()
+
+    universe=list(dict.fromkeys(t for _, mem in mems for t in mem["ticker"].tolist()))
+    px=fetch_prices(universe, days=days_hist)
+    if px.empty: return pd.DataFrame()
+    met_all=universe_metrics((_canon_tickers(universe), days_hist), px)
 
-        px=fetch_prices(mem["ticker"].tolist(), days=days_hist)
-        if px.empty: continue
-
-        met=compute_metrics(px).merge(mem, left_on="Ticker", right_on="ticker", how="left")
+    frames=[]
+    for idx, mem in mems:
+        met=met_all[met_all["Ticker"].isin(mem["ticker"])]
+        if met.empty: continue
+        met=met.merge(mem, left_on="Ticker", right_on="ticker", how="left")
         met["Indice"]=idx
         frames.append(met)
 
     return pd.concat(frames, ignore_index=True, sort=False) if frames else pd.DataFrame()
 
+# Indices de référence (séries Yahoo) pour les comparatifs
+BENCHMARKS = {"CAC 40": "^FCHI", "DAX": "^GDAXI", "NASDAQ 100": "^NDX", "S&P 500": "^GSPC"}
+
+def latest_quotes(tickers, benchmarks=(), days=40):
+    """
+    Dernier cours et variations (compute_metrics) des seuls `tickers` demandés,
+    plus les séries `benchmarks` (symboles Yahoo, cf. BENCHMARKS), sans charger
+    d'univers d'indice. Passe par le stock de prix partagé. Colonne Benchmark
+    (bool) pour distinguer les indices de référence.
+    """
+    bench=set(_canon_tickers(benchmarks))
+    syms=_canon_tickers(list(tickers)+list(bench))
+    if not syms: return compute_metrics(None).assign(Benchmark=pd.Series(dtype=bool))
+    met=compute_metrics(fetch_prices(syms, days=days))
+    met["Benchmark"]=met["Ticker"].isin(bench)
+    return met
+
+def portfolio_valuation(positions, prices, benchmark=None, bench_name="Benchmark"):
+    """
+    Valorisation quotidienne d'un portefeuille. `positions` : colonnes Yahoo, Qty,
+    Type (PEA / CTO…) ; `prices` : format long de fetch_prices ou MarketPanel.
+    Clôtures pivotées (dates × tickers), alignées sur les séances des lignes
+    détenues avec report du dernier cours (un marché fermé ne fait plus chuter
+    le total), puis multipliées par la matrice des quantités (compte × ticker).
+    Renvoie Date / Type (comptes, "Total", `bench_name`) / Valeur / Pct, base 0 au
+    premier jour où toutes les lignes cotées ont un cours ; l'indice est ramené
+    à la valeur initiale du Total.
+    """
+    cols=["Date","Type","Valeur","Pct"]
+    if positions is None or positions.empty: return pd.DataFrame(columns=cols)
+    tick=positions["Yahoo"].fillna("").astype(str).str.strip().str.upper()
+    acct=positions["Type"].fillna("").astype(str).str.strip().str.upper()
+    qty=pd.to_numeric(positions["Qty"], errors="coerce").fillna(0.0)
+    panel=prices if isinstance(prices, MarketPanel) else MarketPanel.from_long(prices)
+    held=panel.select([t for t in tick.unique() if t])
+    if not held.tickers or not len(held): return pd.DataFrame(columns=cols)
+
+    raw=held["Close"]
+    close=held.ffill("Close")
+    quoted=~np.all(np.isnan(raw), axis=0)                       # lignes sans aucun cours ignorées
+    ready=np.all(np.isfinite(close[:, quoted]), axis=1)
+    rows=np.flatnonzero(ready & ~np.all(np.isnan(raw), axis=1))  # séances des lignes détenues
+    if not len(rows): return pd.DataFrame(columns=cols)
+    close=np.nan_to_num(close[rows])
+    dates=held.dates[rows]
+
+    accounts=sorted(acct.unique())
+    inpanel=tick.isin(held._tix).to_numpy()
+    Q=np.zeros((len(accounts), len(held.tickers)))
+    np.add.at(Q, (np.searchsorted(accounts, acct.to_numpy()[inpanel]),
+                  [held._tix[t] for t in tick[inpanel]]), qty.to_numpy()[inpanel])
+    vals=close @ Q.T
+    series={a: vals[:, i] for i, a in enumerate(accounts)}
+    series["Total"]=vals.sum(axis=1)
+    if benchmark and benchmark.upper() in panel:
+        b=panel.ffill("Close")[:, panel.col(benchmark)][rows]
+        ok=np.flatnonzero(np.isfinite(b))
+        if len(ok):
+            series[bench_name]=b / b[ok[0]] * series["Total"][0]
+
+    frames=[]
+    for name, v in series.items():
+        with np.errstate(divide="ignore", invalid="ignore"):
+            b0=v[np.flatnonzero(np.isfinite(v))[0]] if np.isfinite(v).any() else np.nan
+            pct=(v / b0 - 1) * 100
+        frames.append(pd.DataFrame({"Date": dates, "Type": name, "Valeur": v, "Pct": pct}))
+    return pd.concat(frames, ignore_index=True)
+
 # =========================
 # SÉLECTION IA OPTIMALE (TOP N)
 # =========================
@@ -635,13 +2223,19 @@ def select_top_actions(df, profile="Neutre", n=10, include_proximity=True):
     - décision IA stricte
     - niveaux Entrée/Objectif/Stop
     - Potentiel (€) & Proximité (%)
+    Tous les profils sont calculés ensemble et gardés par empreinte de `df`
+    (_frame_fp) : changer de profil sur les mêmes données n'est qu'une lecture.
     """
     if df is None or df.empty:
         return pd.DataFrame()
-
-    p = get_profile_params(profile)
-    vol_max = p["vol_max"]
-
+    tops = _select_all_profiles(df, n, include_proximity)
+    top = tops.get(profile)
+    if top is None:   # profil inconnu -> paramètres Neutre, comme get_profile_params
+        top = _select_all_profiles(df, n, include_proximity, (profile,))[profile]
+    return top.copy()
+
+@ttl_cache(ttl=PRICE_MEM_TTL, max_bytes=16*2**20, maxsize=16, key=_frame_key)
+def _select_all_profiles(df, n, include_proximity, profiles=tuple(PROFILE_PARAMS)):
     data = df.copy()
     needed = ["trend_score","lt_trend_score","pct_7d","pct_30d","ATR14","Close"]
     for c in needed:
@@ -658,32 +2252,33 @@ def select_top_actions(df, profile="Neutre", n=10, include_proximity=True):
         - (data["Volatilité"].fillna(0)      * 10.0)
     )
 
-    data["Signal"] = data.apply(lambda r: decision_label_strict(r, profile=profile, held=False), axis=1)
-
-    # Garde signaux "Acheter" et vol maîtrisée
-    filt = (data["Signal"].str.contains("🟢", na=False)) & (data["Volatilité"] <= vol_max * 1.5)
-    data = data[filt].sort_values("IA_Score", ascending=False)
-
-    def _levels(r):
-        lev = price_levels_from_row(r, profile)
-        pot_eur = None
-        prox_pct = None
-        if lev["entry"] and lev["target"]:
-            pot_eur = lev["target"] - lev["entry"]
-        if lev["entry"] and r.get("Close"):
-            entry = lev["entry"]
-            if entry and entry > 0:
-                prox_pct = ((r["Close"] / entry) - 1) * 100
-        return pd.Series({
-            "Entrée (€)": lev["entry"],
-            "Objectif (€)": lev["target"],
-            "Stop (€)": lev["stop"],
-            "Potentiel (€)": pot_eur,
-            "Proximité (%)": prox_pct
-        })
-
-    levs = data.apply(_levels, axis=1)
-    top = pd.concat([data.reset_index(drop=True), levs.reset_index(drop=True)], axis=1).head(n)
+    signals = decide_profiles(data, profiles, held=False)
+    vol = data["Volatilité"].to_numpy(dtype=float)
+    score = -data["IA_Score"].to_numpy(dtype=float)
+    out = {}
+    for profile in profiles:
+        # Garde signaux "Acheter" et vol maîtrisée
+        sig = signals[profile].to_numpy()
+        keep = np.flatnonzero((sig == "🟢 Acheter") & (vol <= get_profile_params(profile)["vol_max"] * 1.5))
+
+        # Top n par tri partiel (argpartition), seuls les n retenus sont triés
+        k = min(max(int(n), 0), len(keep))
+        idx = keep[np.argpartition(score[keep], k - 1)[:k]] if 0 < k < len(keep) else keep[:k]
+        idx = idx[np.argsort(score[idx], kind="stable")]
+        top = data.iloc[idx].reset_index(drop=True)
+        top["Signal"] = signals[profile].iloc[idx].reset_index(drop=True)
+        out[profile] = _format_top(top, profile, df.columns, include_proximity)
+    return out
+
+def _format_top(top, profile, src_cols, include_proximity):
+    # Niveaux, potentiel & proximité en tableaux
+    lev = price_levels(top, profile)
+    entry, target = lev["entry"].to_numpy(), lev["target"].to_numpy()
+    close = top["Close"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        top["Entrée (€)"], top["Objectif (€)"], top["Stop (€)"] = entry, target, lev["stop"].to_numpy()
+        top["Potentiel (€)"] = np.where((entry != 0) & (target != 0), target - entry, np.nan)
+        top["Proximité (%)"] = np.where((entry > 0) & (close != 0), (close / entry - 1) * 100, np.nan)
 
     keep = ["Ticker","name","Close","MA20","MA50","MA120","MA240",
             "trend_score","lt_trend_score","pct_7d","pct_30d",
@@ -705,7 +2300,7 @@ def select_top_actions(df, profile="Neutre", n=10, include_proximity=True):
     if "Perf 7j (%)" in top.columns:   top["Perf 7j (%)"]   = (top["Perf 7j (%)"]*100).round(2)
     if "Perf 30j (%)" in top.columns and "Perf 30j (%)" not in top:  # garde compat si nom différent
         pass
-    if "pct_30d" in df.columns and "Perf 30j (%)" in top.columns:
+    if "pct_30d" in src_cols and "Perf 30j (%)" in top.columns:
         top["Perf 30j (%)"]  = top["Perf 30j (%)"].round(2)
     if "Risque" in top.columns:        top["Risque"]        = (top["Risque"]*100).round(2)
     if "Score IA" in top.columns:      top["Score IA"]      = top["Score IA"].round(2)
@@ -715,3 +2310,534 @@ def select_top_actions(df, profile="Neutre", n=10, include_proximity=True):
         top["Proximité (%)"] = top["Proximité (%)"].round(2)
 
     return top.reset_index(drop=True)
+
+# =========================
+# BACKTEST DES RÈGLES IA (vectorisé)
+# =========================
+# Chaque jour où un ticker passe "🟢 Acheter" (selon le profil) ouvre un événement :
+# ordre limite à l'Entrée valable BT_ENTRY_WINDOW séances, puis sortie au premier
+# franchissement de l'Objectif ou du Stop (stop prioritaire si les deux le même
+# jour), sinon à la clôture après BT_MAX_HOLD séances. Niveaux figés au signal ;
+# séances comptées sur le calendrier du ticker (cf. _sessions).
+BT_ENTRY_WINDOW = 5
+BT_MAX_HOLD = 30
+
+def _panel_rolling_mean(a, window, min_periods):
+    """Moyenne glissante par colonne ignorant les NaN (sommes cumulées)."""
+    ok = ~np.isnan(a)
+    c = np.vstack([np.zeros((1, a.shape[1])), np.cumsum(np.where(ok, a, 0.0), axis=0)])
+    n = np.vstack([np.zeros((1, a.shape[1]), dtype=np.int64), np.cumsum(ok, axis=0)])
+    lo = np.maximum(np.arange(1, a.shape[0]+1) - window, 0)
+    s, k = c[1:] - c[lo], n[1:] - n[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(k >= min_periods, s / k, np.nan)
+
+def _panel_live(panel):
+    """Cases (date, ticker) où le ticker a coté : les lignes que verrait compute_metrics."""
+    live = np.zeros(panel["Close"].shape, dtype=bool)
+    for f in ("Open", "High", "Low", "Close"):
+        if f in panel.fields: live |= np.isfinite(panel[f])
+    return live
+
+def _fresh_signals(buy, live):
+    """Premier jour de chaque série de signaux ; les dates où le ticker n'a pas coté ne coupent pas la série."""
+    held = pd.DataFrame(np.where(live, buy, np.nan)).ffill().fillna(0).to_numpy(bool)
+    return buy & ~np.vstack([np.zeros((1, buy.shape[1]), dtype=bool), held[:-1]])
+
+def _session_order(live):
+    """
+    Compactage par colonne sur les séances du ticker : `order` (séances d'abord,
+    dans l'ordre ; ligne compactée -> ligne du panel) et le masque compacté.
+    """
+    order = np.argsort(~live, axis=0, kind="stable")
+    return order, np.take_along_axis(live, order, axis=0)
+
+def _pack(a, order, live_c):
+    return np.where(live_c, np.take_along_axis(a, order, axis=0), np.nan)
+
+def panel_indicators(panel):
+    """
+    Indicateurs de compute_metrics pour chaque date du panel : {nom: tableau dates × tickers}.
+    Les fenêtres glissantes portent sur les séances de chaque ticker (colonnes
+    compactées, puis remises sur l'axe des dates) et non sur l'union des calendriers.
+    """
+    live = _panel_live(panel)
+    order, live_c = _session_order(live)
+
+    def pack(a):
+        return _pack(a, order, live_c)
+
+    def unpack(a):
+        out = np.empty_like(a)
+        np.put_along_axis(out, order, a, axis=0)
+        return np.where(live, out, np.nan)
+
+    close, high, low = pack(panel["Close"]), pack(panel["High"]), pack(panel["Low"])
+    prev = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    with np.errstate(invalid="ignore"):
+        tr = np.fmax(np.fmax(high-low, np.abs(high-prev)), np.abs(low-prev))
+    out = {"ATR14": unpack(_panel_rolling_mean(tr, 14, 5))}
+    for name in ("MA20", "MA50", "MA120", "MA240"):
+        w, mp = _INDICATOR_WINDOWS[name]
+        out[name] = unpack(_panel_rolling_mean(close, w, mp))
+    close = panel["Close"]
+    # variations calendaires : dernier cours connu à la date - h jours, à défaut
+    # le cours de la première séance du ticker (repli de _calendar_returns)
+    cl = panel.ffill("Close")
+    first = np.where(live.any(axis=0), close[live.argmax(axis=0), np.arange(close.shape[1])], np.nan)
+    for col, h in (("pct_7d", 7), ("pct_30d", 30)):
+        ref = panel.dates.searchsorted(panel.dates - pd.Timedelta(days=h), side="right") - 1
+        base = np.where(ref[:, None] >= 0, cl[np.maximum(ref, 0)], np.nan)
+        base = np.where(np.isnan(base), first, base)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[col] = np.where(base > 0, close / base - 1, np.nan)
+    return out
+
+def _first_true(mask):
+    """Indice du premier True par ligne, mask.shape[1] si aucun."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), mask.shape[1])
+
+def _sessions(panel, live):
+    """
+    Cours compactés sur les séances de chaque ticker : la fenêtre d'entrée et la
+    durée de détention se comptent en séances du ticker, pas en lignes de l'union
+    des calendriers. Renvoie (order, pos, op, hi, lo, close) : `order` de
+    _session_order, `pos` rang de séance de chaque case (date, ticker), Close
+    reporté sur les séances sans clôture.
+    """
+    order, live_c = _session_order(live)
+    op = panel["Open"] if "Open" in panel.fields else panel["Close"]
+    op, hi, lo, close = (_pack(a, order, live_c) for a in (op, panel["High"], panel["Low"], panel["Close"]))
+    close = np.where(live_c, pd.DataFrame(close).ffill().to_numpy(), np.nan)
+    return order, np.cumsum(live, axis=0) - 1, op, hi, lo, close
+
+def _sim_complete(pos, ti, tj, entry_window, max_hold):
+    """Événements dont la fenêtre d'entrée et la détention tiennent dans les séances connues du ticker."""
+    return pos[ti, tj] < pos[-1, tj] - entry_window - max_hold
+
+def _sim_entry(op, lo, ti, tj, entry, entry_window):
+    """Entrée : premier Low <= Entrée dans la fenêtre (ouverture si gap en dessous). Lignes en séances du ticker."""
+    rows = ti[:, None] + 1 + np.arange(entry_window)
+    with np.errstate(invalid="ignore"):
+        k = _first_true(lo[rows, tj[:, None]] <= entry[:, None])
+    f = ti + 1 + np.minimum(k, entry_window - 1)
+    return k < entry_window, f, np.fmin(entry, op[f, tj])
+
+def _sim_windows(hi, lo, f, tj, max_hold):
+    """Hauts / bas des `max_hold` séances qui suivent l'entrée (événements × séances)."""
+    rows = f[:, None] + 1 + np.arange(max_hold)
+    return hi[rows, tj[:, None]], lo[rows, tj[:, None]]
+
+def _sim_exit(op, close, f, tj, hw, lw, target, stop):
+    """Sortie sur les fenêtres de _sim_windows : stop / objectif / échéance."""
+    max_hold = hw.shape[1]
+    with np.errstate(invalid="ignore"):
+        ks = _first_true(lw <= stop[:, None])
+        kt = _first_true(hw >= target[:, None])
+    hit_stop = (ks < max_hold) & (ks <= kt)
+    hit_target = (kt < max_hold) & ~hit_stop
+    x = f + 1 + np.where(hit_stop, ks, np.where(hit_target, kt, max_hold - 1))
+    exit_px = np.where(hit_stop, np.fmin(stop, op[x, tj]),
+              np.where(hit_target, np.fmax(target, op[x, tj]), close[x, tj]))
+    return hit_target, hit_stop, x, exit_px
+
+def _simulate(panel, sess, ti, tj, entry, target, stop, entry_window, max_hold):
+    _, pos, op, hi, lo, close = sess
+    filled, f, fill = _sim_entry(op, lo, pos[ti, tj], tj, entry, entry_window)
+    hw, lw = _sim_windows(hi, lo, f, tj, max_hold)
+    hit_target, hit_stop, x, exit_px = _sim_exit(op, close, f, tj, hw, lw, target, stop)
+    return pd.DataFrame({
+        "Ticker": np.asarray(panel.tickers, dtype=object)[tj], "Signal": panel.dates[ti],
+        "filled": filled, "Entrée": np.where(filled, fill, np.nan),
+        "Sortie": np.where(filled, exit_px, np.nan),
+        "exit": np.select([~filled, hit_target, hit_stop], ["none", "target", "stop"], "timeout"),
+        "jours": np.where(filled, x - f, np.nan),
+    })
+
+def backtest_rules(panel, profiles=None, groups=None, entry_window=BT_ENTRY_WINDOW,
+                   max_hold=BT_MAX_HOLD, fresh_only=True):
+    """
+    Rejoue decision_label_strict + price_levels_from_row sur toutes les dates du
+    panel, pour chaque profil. `groups` : {indice: tickers} pour le rapport (tout
+    le panel sinon). `fresh_only` : un événement seulement au premier jour d'une
+    série de signaux. Renvoie (synthèse par indice × profil, trades).
+    """
+    profiles = list(profiles or PROFILE_PARAMS)
+    ind = panel_indicators(panel)
+    px, live = panel["Close"], _panel_live(panel)
+    ct_ok, lt_ok, vol, mom_ok = _rule_masks(px, ind["MA20"], ind["MA50"], ind["MA120"], ind["MA240"],
+                                            ind["ATR14"], ind["pct_7d"], ind["pct_30d"])
+    core = np.isfinite(px) & ct_ok & lt_ok & mom_ok
+    base = np.where(np.isfinite(ind["MA20"]), ind["MA20"], px)
+    sess = _sessions(panel, live)
+
+    trades = []
+    for prof in profiles:
+        p = get_profile_params(prof)
+        buy = core & (vol <= p["vol_max"] * _VOL_FACTOR.get(prof, 1.0))
+        if fresh_only:
+            buy = _fresh_signals(buy, live)
+        ti, tj = np.nonzero(buy)
+        keep = _sim_complete(sess[1], ti, tj, entry_window, max_hold)   # événements complets seulement
+        ti, tj = ti[keep], tj[keep]
+        if not len(ti): continue
+        b = base[ti, tj]
+        t = _simulate(panel, sess, ti, tj, b*p["entry_mult"], b*p["target_mult"], b*p["stop_mult"],
+                      entry_window, max_hold)
+        trades.append(t.assign(Profil=prof))
+    cols = ["Ticker","Signal","Profil","filled","Entrée","Sortie","exit","jours"]
+    trades = pd.concat(trades, ignore_index=True)[cols] if trades else pd.DataFrame(columns=cols)
+    trades["Rendement"] = trades["Sortie"] / trades["Entrée"] - 1
+
+    groups = groups or {"Panel": panel.tickers}
+    member = pd.DataFrame([(g, str(t).upper()) for g, ts in groups.items() for t in ts],
+                          columns=["Indice", "Ticker"]).drop_duplicates()
+    tr = trades.merge(member, on="Ticker")
+    done = tr[tr["filled"]]
+    agg = tr.groupby(["Indice", "Profil"]).agg(Signaux=("Ticker", "size"), Trades=("filled", "sum"))
+    res = done.groupby(["Indice", "Profil"]).agg(
+        Réussite=("exit", lambda e: (e == "target").mean()),
+        Stops=("exit", lambda e: (e == "stop").mean()),
+        Rendement_moy=("Rendement", "mean"), Rendement_med=("Rendement", "median"),
+        Durée_moy=("jours", "mean"))
+    summary = agg.join(res).reset_index()
+    summary["Exécution"] = summary["Trades"] / summary["Signaux"]
+    return summary, trades
+
+def _markets_panel(indices, years):
+    """Membres actuels des indices ({indice: tickers}) et leur historique stocké (+ chauffe MA240)."""
+    with ThreadPoolExecutor(max_workers=len(indices)) as pool:
+        mems = dict(zip(indices, pool.map(_market_members, indices)))
+    groups = {i: m["ticker"].tolist() for i, m in mems.items() if m is not None and not m.empty}
+    return groups, fetch_panel([t for ts in groups.values() for t in ts], days=int(365*years) + 370)
+
+def backtest_markets(indices=("CAC 40", "DAX", "NASDAQ 100", "S&P 500"), years=10, **kw):
+    """backtest_rules sur l'historique stocké des membres actuels des indices."""
+    groups, panel = _markets_panel(indices, years)
+    return backtest_rules(panel, groups=groups, **kw)
+
+# =========================
+# SIMULATION MONTE CARLO (injection micro-investissement)
+# =========================
+# Rééchantillonnage (bootstrap) des rendements quotidiens historiques de chaque
+# candidat : trajectoires de clôtures sur MC_HORIZON séances à partir du dernier
+# cours, achat à l'Entrée (ou tout de suite si le cours est déjà dessous), sortie
+# à l'Objectif / au Stop au premier franchissement (au niveau, ou à la clôture si
+# elle l'a dépassé, dans les deux sens), sinon au dernier jour. Frais
+# d'entrée / sortie comme dans le simulateur de la Synthèse Flash. Un candidat par
+# tâche, sur un pool de processus réutilisé.
+MC_PATHS = 10_000
+MC_HORIZON = 21            # ~30 jours calendaires
+MC_HISTORY_DAYS = 400
+MC_PERCENTILES = (5, 25, 50, 75, 95)
+# En dessous (candidats × trajectoires × séances), calcul sur place : ~50 ns par
+# cellule mesurés (≈ 25 ms à 500 000), contre ~2 ms par tâche sur le pool lancé.
+# 10 candidats × MC_PATHS × MC_HORIZON (2,1 M) passent donc par le pool.
+MC_POOL_MIN_CELLS = 500_000
+
+_proc_pool = None
+_proc_lock = threading.Lock()
+
+def _process_pool(workers=None):
+    """Pool de processus partagé (créé à la demande, gardé pour les appels suivants)."""
+    global _proc_pool
+    with _proc_lock:
+        want = workers or min(os.cpu_count() or 1, 8)
+        if _proc_pool is None or _proc_pool._max_workers < want:
+            if _proc_pool is not None: _proc_pool.shutdown(wait=False)
+            _proc_pool = ProcessPoolExecutor(max_workers=want)
+        return _proc_pool
+
+def _mc_paths(rets, s0, entry, target, stop, invest, fee_in, fee_out, horizon, n_paths, seed):
+    """Une simulation (exécutée dans un processus du pool). Renvoie les rendements nets (%) et l'issue."""
+    rng = np.random.default_rng(seed)
+    px = s0 * np.cumprod(1.0 + rets[rng.integers(0, len(rets), (n_paths, horizon))], axis=1)
+    steps = np.arange(horizon)
+    # entrée
+    if s0 <= entry:
+        f, fill = np.full(n_paths, -1), np.full(n_paths, s0)
+    else:
+        f = _first_true(px <= entry)
+        fill = np.full(n_paths, entry)
+    filled = f < horizon
+    # sortie
+    after = steps[None, :] > f[:, None]
+    ks, kt = _first_true((px <= stop) & after), _first_true((px >= target) & after)
+    hit_stop = filled & (ks < horizon) & (ks <= kt)
+    hit_target = filled & (kt < horizon) & ~hit_stop
+    # même règle des deux côtés : niveau, ou clôture du franchissement si elle l'a dépassé
+    k = np.minimum(np.where(hit_stop, ks, kt), horizon-1)
+    cross = px[np.arange(n_paths), k]
+    exit_px = np.where(hit_stop, np.minimum(stop, cross),
+              np.where(hit_target, np.maximum(target, cross), px[:, -1]))
+    # frais dilués (mêmes formules que la page)
+    buy_price = fill + fee_in / np.maximum(invest / np.maximum(fill, 1e-8), 1e-8)
+    shares = invest / buy_price
+    net = np.where(filled, ((exit_px - buy_price) * shares - fee_out) / invest * 100, 0.0)
+    return net, filled, hit_target, hit_stop
+
+def simulate_outcomes(candidates, invest=40.0, fee_in=1.0, fee_out=1.0, n_paths=MC_PATHS,
+                      horizon=MC_HORIZON, seed=0, workers=None):
+    """
+    Monte Carlo des lignes d'injection (colonnes Ticker, Entrée (€), Objectif (€),
+    Stop (€)). Renvoie par Ticker : probabilités d'exécution / d'objectif / de stop
+    (%), rendement net espéré (%) et percentiles MC_PERCENTILES du rendement net
+    (trajectoires non exécutées comptées à 0). `workers=0` : calcul sur place ;
+    None : pool de processus si le volume dépasse MC_POOL_MIN_CELLS.
+    """
+    cols = ["Ticker","P(exécution) %","P(objectif) %","P(stop) %","Rendement net espéré (%)"] \
+           + [f"P{q} (%)" for q in MC_PERCENTILES]
+    if candidates is None or candidates.empty: return pd.DataFrame(columns=cols)
+    c = candidates.assign(Ticker=candidates["Ticker"].astype(str).str.strip().str.upper())
+    panel = fetch_panel(c["Ticker"].unique(), days=MC_HISTORY_DAYS)
+
+    levels = np.column_stack([_num(c, col) for col in ("Entrée (€)","Objectif (€)","Stop (€)")])
+
+    jobs = {}
+    for i, (t, lv) in enumerate(zip(c["Ticker"], levels)):
+        if t not in panel or not np.isfinite(lv).all() or lv[0] <= 0: continue
+        cl = panel.series(t).dropna().to_numpy()
+        rets = cl[1:] / cl[:-1] - 1
+        rets = rets[np.isfinite(rets)]
+        if len(rets) < 20: continue
+        jobs[i] = (rets, float(cl[-1]), *lv.tolist(), float(invest), float(fee_in), float(fee_out),
+                   int(horizon), int(n_paths), seed + i)
+
+    cells = len(jobs) * int(n_paths) * int(horizon)
+    if workers is None and (cells < MC_POOL_MIN_CELLS or (os.cpu_count() or 1) < 2):
+        workers = 0
+    if workers == 0 or len(jobs) <= 1:
+        res = {i: _mc_paths(*a) for i, a in jobs.items()}
+    else:
+        pool = _process_pool(workers)
+        futs = {i: pool.submit(_mc_paths, *a) for i, a in jobs.items()}
+        res = {i: f.result() for i, f in futs.items()}
+
+    rows = []
+    for i, t in enumerate(c["Ticker"]):
+        if i not in res:
+            rows.append([t] + [np.nan] * (len(cols) - 1)); continue
+        net, filled, tgt, stp = res[i]
+        rows.append([t, filled.mean()*100, tgt.mean()*100, stp.mean()*100, net.mean()]
+                    + list(np.percentile(net, MC_PERCENTILES)))
+    return pd.DataFrame(rows, columns=cols, index=candidates.index).round(2)
+
+# =========================
+# OPTIMISATION WALK-FORWARD DES PROFILS
+# =========================
+# Recherche des multiplicateurs de PROFILE_PARAMS par profil (grille complète ou
+# tirages aléatoires), sur les mêmes règles que backtest_rules. L'historique utile
+# est découpé en OPT_FOLDS+1 blocs chronologiques : le pli k s'entraîne sur les
+# blocs qui précèdent (fenêtre croissante) et se teste sur le bloc k. Les signaux
+# des dernières séances d'un bloc, dont l'issue déborde sur le suivant, sont
+# exclus de l'entraînement du pli qui teste ce suivant. Les tableaux de cours et
+# d'indicateurs sont déposés une fois en mémoire partagée ; chaque tâche du pool
+# (un profil × un vol_max, toutes ses combinaisons Entrée/Objectif/Stop) s'y
+# attache le temps de copier les séances utiles de ses événements. Les candidats
+# sont classés sur le score en échantillon ; le hors échantillon ne compte que
+# les plis où la combinaison a été choisie à l'entraînement.
+OPT_PARAMS = ("vol_max", "target_mult", "stop_mult", "entry_mult")
+OPT_GRID = {
+    "vol_max":     (0.02, 0.03, 0.04, 0.05, 0.06, 0.08, 0.10),
+    "target_mult": (1.03, 1.05, 1.07, 1.10, 1.13, 1.16),
+    "stop_mult":   (0.90, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98),
+    "entry_mult":  (0.980, 0.985, 0.990, 0.995, 1.000),
+}
+OPT_RANGES = {     # tirages aléatoires : (min, max, pas)
+    "vol_max": (0.015, 0.12, 0.005), "target_mult": (1.02, 1.20, 0.005),
+    "stop_mult": (0.88, 0.985, 0.005), "entry_mult": (0.975, 1.0, 0.0025),
+}
+OPT_FOLDS = 4
+OPT_MIN_TRADES = 30     # en dessous, pas de score (combinaison non retenue)
+_OPT_STATS = ("Signaux", "Trades", "somme", "somme2", "Objectifs", "Stops")
+
+def opt_param_sets(profile, grid=None, n_random=None, seed=0):
+    """
+    Combinaisons à évaluer pour un profil : grille complète (OPT_GRID par défaut)
+    ou `n_random` tirages dans OPT_RANGES. Le réglage actuel est toujours en
+    première ligne ; combinaisons incohérentes (Stop ≥ Entrée ≥ Objectif) écartées.
+    """
+    if n_random:
+        rng = np.random.default_rng(seed)
+        sets = pd.DataFrame({k: np.round(lo + step * rng.integers(0, int(round((hi - lo) / step)) + 1, n_random), 4)
+                             for k, (lo, hi, step) in OPT_RANGES.items()})
+    else:
+        g = grid or OPT_GRID
+        sets = pd.MultiIndex.from_product([g[k] for k in OPT_PARAMS], names=OPT_PARAMS).to_frame(index=False)
+    current = pd.DataFrame([{k: get_profile_params(profile)[k] for k in OPT_PARAMS}])
+    sets = pd.concat([current, sets[list(OPT_PARAMS)]], ignore_index=True)
+    sets = sets[(sets["stop_mult"] < sets["entry_mult"]) & (sets["entry_mult"] < sets["target_mult"])]
+    return sets.drop_duplicates(ignore_index=True)
+
+def _shm_read(name, shape, fn, *args):
+    """
+    Ouvre le bloc partagé `name` le temps de fn(vue en lecture seule, *args) puis le
+    ferme : `fn` ne renvoie que des copies, rien ne reste projeté après la tâche.
+    Le bloc appartient au processus qui l'a créé (seul à faire unlink) : ouvert sans
+    suivi en 3.13+ ; avant, l'inscription de l'ouverture va au resource_tracker du
+    parent, hérité par le pool, où elle double celle de la création et disparaît
+    avec son unlink (la désinscrire ici retirerait celle du parent).
+    """
+    shm = shared_memory.SharedMemory(name=name, **({"track": False} if sys.version_info >= (3, 13) else {}))
+    try:
+        view = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        view.flags.writeable = False
+        res = fn(view, *args)
+        del view
+        return res
+    finally:
+        shm.close()
+
+def _opt_events(fields, profile, vol_max, bounds, entry_window, max_hold):
+    """
+    Événements d'une tâche, lus dans les tableaux partagés : cellule (bloc, fin de
+    bloc), base des niveaux et Open/High/Low/Close copiés sur les seules séances
+    utiles (du signal à la fin de détention, séances × événements).
+    """
+    op, hi, lo, close, order, pos, base, vol, core, live = fields
+    buy = (core > 0) & (vol <= vol_max * _VOL_FACTOR.get(profile, 1.0))
+    buy = _fresh_signals(buy, live > 0)
+    ti, tj = np.nonzero(buy[bounds[0]:bounds[-1]])
+    ti += bounds[0]
+    keep = _sim_complete(pos, ti, tj, entry_window, max_hold)
+    ti, tj = ti[keep], tj[keep]
+    si = pos[ti, tj].astype(np.intp)
+    blk = np.searchsorted(bounds, ti, side="right") - 1
+    # fin de bloc : la dernière séance que peut toucher l'événement tombe dans le bloc suivant
+    cell = blk * 2 + (order[si + entry_window + max_hold, tj] >= bounds[blk + 1])
+    rows = si[None, :] + np.arange(entry_window + max_hold + 1)[:, None]
+    return cell, base[ti, tj], tuple(a[rows, tj] for a in (op, hi, lo, close))
+
+def _opt_eval(name, shape, profile, vol_max, combos, bounds, entry_window, max_hold):
+    """
+    Une tâche du pool : un profil × un vol_max, combinaisons (entry_mult,
+    target_mult, stop_mult) triées par Entrée (phase d'entrée rejouée une fois
+    par valeur). Renvoie combinaisons × blocs × (corps, fin de bloc) × _OPT_STATS.
+    """
+    cell, b, (op, hi, lo, close) = _shm_read(name, shape, _opt_events, profile, vol_max, bounds,
+                                             entry_window, max_hold)
+    nb = len(bounds) - 1
+    sig = np.bincount(cell, minlength=2 * nb)
+    ev = np.arange(len(b))                      # une colonne par événement, signal en ligne 0
+
+    out = np.zeros((len(combos), 2 * nb, len(_OPT_STATS)))
+    last = None
+    for c, (em, tm, sm) in enumerate(combos):
+        if em != last:
+            filled, f, fill = _sim_entry(op, lo, np.zeros_like(ev), ev, b * em, entry_window)
+            fc, ff, fj, fb, fx = cell[filled], f[filled], ev[filled], b[filled], fill[filled]
+            hw, lw = _sim_windows(hi, lo, ff, fj, max_hold)
+            last = em
+        hit_t, hit_s, _, px = _sim_exit(op, close, ff, fj, hw, lw, fb * tm, fb * sm)
+        r = px / fx - 1
+        out[c] = np.column_stack([sig] + [np.bincount(fc, w, minlength=2 * nb)
+                                          for w in (None, r, r * r, hit_t, hit_s)])
+    return out.reshape(len(combos), nb, 2, len(_OPT_STATS))
+
+def _opt_report(st, min_trades):
+    """Stats agrégées (… × _OPT_STATS) → colonnes de rapport, dont le score t = moy / écart-type × √n."""
+    sig, n, s, s2, tgt, stp = np.moveaxis(st, -1, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s / n
+        sd = np.sqrt(np.maximum(s2 / n - mean**2, 0) * n / (n - 1))
+        score = np.where(n >= min_trades, mean / sd * np.sqrt(n), np.nan)
+        return {"Trades": n, "Exécution": n / sig, "Réussite": tgt / n, "Stops": stp / n,
+                "Rendement_moy": mean, "Score": score}
+
+def optimize_profiles(panel, profiles=None, n_random=None, grid=None, folds=OPT_FOLDS,
+                      entry_window=BT_ENTRY_WINDOW, max_hold=BT_MAX_HOLD,
+                      min_trades=OPT_MIN_TRADES, top=10, seed=0, workers=None):
+    """
+    Walk-forward des multiplicateurs de PROFILE_PARAMS sur `panel`. `workers=0` :
+    évaluation sur place ; None : pool de processus dès que plusieurs CPU.
+    Renvoie (candidats, walk_forward) :
+    - candidats : par profil, les `top` combinaisons au meilleur score en
+      échantillon (IS, entraînement du dernier pli) + le réglage actuel ; stats
+      hors échantillon (OOS) cumulées sur les seuls plis où la combinaison a été
+      retenue à l'entraînement (vides sinon)
+    - walk_forward : par profil et pli, la combinaison retenue à l'entraînement et
+      son résultat sur le bloc de test suivant ; ligne "Total" = OOS enchaîné.
+    """
+    profiles = list(profiles or PROFILE_PARAMS)
+    ind = panel_indicators(panel)
+    px = panel["Close"]
+    ct_ok, lt_ok, vol, mom_ok = _rule_masks(px, ind["MA20"], ind["MA50"], ind["MA120"], ind["MA240"],
+                                            ind["ATR14"], ind["pct_7d"], ind["pct_30d"])
+    core = np.isfinite(px) & ct_ok & lt_ok & mom_ok
+    rows = np.flatnonzero(core.any(axis=1))
+    end = len(panel.dates) - entry_window - max_hold - 1
+    if not len(rows) or end - rows[0] < 2 * (folds + 1) * (entry_window + max_hold + 1):
+        raise ValueError("Historique trop court pour le walk-forward demandé.")
+    bounds = np.linspace(rows[0], end, folds + 2).round().astype(int)
+
+    live = _panel_live(panel)
+    order, pos, op, hi, lo, close = _sessions(panel, live)
+    fields = (op, hi, lo, close, order, pos, np.where(np.isfinite(ind["MA20"]), ind["MA20"], px),
+              vol, core, live)
+    shape = (len(fields), *px.shape)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        view = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        for i, a in enumerate(fields): view[i] = a
+        del view, fields, ind, ct_ok, lt_ok, mom_ok, order, pos, op, hi, lo, close
+        shm.close()     # plus projeté ici : un pool lancé (fork) ensuite n'en hérite pas
+
+        sets, tasks = {}, []
+        for prof in profiles:
+            sets[prof] = ps = opt_param_sets(prof, grid, n_random, seed)
+            for vm, g in ps.sort_values(["vol_max", "entry_mult"]).groupby("vol_max", sort=False):
+                combos = list(zip(g["entry_mult"], g["target_mult"], g["stop_mult"]))
+                tasks.append((prof, g.index.to_numpy(),
+                              (shm.name, shape, prof, float(vm), combos, bounds, entry_window, max_hold)))
+        if workers is None and (os.cpu_count() or 1) < 2: workers = 0
+        if workers == 0:
+            results = [_opt_eval(*a) for _, _, a in tasks]
+        else:
+            pool = _process_pool(workers)
+            results = [f.result() for f in [pool.submit(_opt_eval, *a) for _, _, a in tasks]]
+    finally:
+        shm.close(); shm.unlink()
+
+    nb = folds + 1
+    stats = {p: np.zeros((len(sets[p]), nb, 2, len(_OPT_STATS))) for p in profiles}
+    for (prof, idx, _), res in zip(tasks, results):
+        stats[prof][idx] = res
+
+    cands, walk = [], []
+    for prof in profiles:
+        st, ps = stats[prof], sets[prof]
+        test = st.sum(axis=2)                                     # P × blocs × stats
+        train = [st[:, :k].sum(axis=(1, 2)) - st[:, k-1, 1] for k in range(1, nb)]
+        picks = []
+        for k in range(1, nb):
+            sc = _opt_report(train[k-1], min_trades)["Score"]
+            if np.isnan(sc).all(): continue
+            j = int(np.nanargmax(sc)); picks.append((k, j))
+            w = _opt_report(test[j, k], min_trades)
+            walk.append({"Profil": prof, "Pli": k, "Test début": panel.dates[bounds[k]],
+                         "Test fin": panel.dates[bounds[k+1] - 1], **ps.iloc[j].to_dict(),
+                         "IS Score": float(sc[j]), **{c: float(v) for c, v in w.items()}})
+        if picks:
+            w = _opt_report(sum(test[j, k] for k, j in picks), min_trades)
+            walk.append({"Profil": prof, "Pli": "Total", **{c: float(v) for c, v in w.items()}})
+
+        # hors échantillon : seuls les blocs de test des plis où la combinaison a été
+        # retenue à l'entraînement (aucun choix fait sur le test)
+        oos, pos_folds = np.zeros_like(test[:, 0]), np.zeros(len(ps), dtype=int)
+        for k, j in picks:
+            oos[j] += test[j, k]
+            pos_folds[j] += test[j, k, 2] > 0
+        rep = ps.assign(Profil=prof, Actuel=ps.index == 0)[["Profil", *OPT_PARAMS, "Actuel"]]
+        for tag, agg in (("IS", train[-1]), ("OOS", oos)):
+            rep = rep.assign(**{f"{tag} {k}": v for k, v in _opt_report(agg, min_trades).items()})
+        rep["Retenu"] = np.bincount([j for _, j in picks], minlength=len(ps))
+        rep["Plis OOS > 0"] = pos_folds
+        oos_cols = [c for c in rep.columns if c.startswith("OOS ")] + ["Plis OOS > 0"]
+        rep[oos_cols] = rep[oos_cols].where(rep["Retenu"] > 0)
+        rep = rep.sort_values("IS Score", ascending=False, na_position="last")
+        cands.append(rep[(np.arange(len(rep)) < top) | rep["Actuel"]])
+    return pd.concat(cands, ignore_index=True), pd.DataFrame(walk)
+
+def optimize_markets(indices=("CAC 40", "DAX", "NASDAQ 100", "S&P 500"), years=10, **kw):
+    """optimize_profiles sur l'historique stocké des membres actuels des indices."""
+    return optimize_profiles(_markets_panel(indices, years)[1], **kw)
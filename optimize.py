@@ -0,0 +1,46 @@
+"""
+Optimisation walk-forward des multiplicateurs de PROFILE_PARAMS (tâche batch) :
+historique stocké des membres actuels des indices, évaluations réparties sur un
+pool de processus, candidats et résultats hors échantillon écrits en CSV.
+
+    python optimize.py [--years 10] [--folds 4] [--random N] [--workers N] [--top 10]
+                       [--profiles Neutre ...] [--indices "CAC 40" ...] [--out data/optimize]
+"""
+import argparse, os, time
+import pandas as pd
+from lib import DATA_DIR, OPT_FOLDS, OPT_PARAMS, PROFILE_PARAMS, optimize_markets
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--indices", nargs="+", default=["CAC 40", "DAX", "NASDAQ 100", "S&P 500"])
+    ap.add_argument("--profiles", nargs="+", default=list(PROFILE_PARAMS), choices=list(PROFILE_PARAMS))
+    ap.add_argument("--years", type=float, default=10)
+    ap.add_argument("--folds", type=int, default=OPT_FOLDS)
+    ap.add_argument("--random", type=int, default=None, help="tirages aléatoires par profil (grille sinon)")
+    ap.add_argument("--workers", type=int, default=None, help="processus (0 : sur place)")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=os.path.join(DATA_DIR, "optimize"))
+    a = ap.parse_args(argv)
+
+    t = time.perf_counter()
+    cands, walk = optimize_markets(a.indices, a.years, profiles=a.profiles, n_random=a.random,
+                                   folds=a.folds, top=a.top, seed=a.seed, workers=a.workers)
+    print(f"Optimisation terminée en {time.perf_counter() - t:.1f} s\n")
+
+    os.makedirs(a.out, exist_ok=True)
+    stamp = pd.Timestamp.now().strftime("%Y%m%d-%H%M")
+    cands.to_csv(os.path.join(a.out, f"candidats-{stamp}.csv"), index=False)
+    walk.to_csv(os.path.join(a.out, f"walk_forward-{stamp}.csv"), index=False)
+
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.precision", 4):
+        print("Walk-forward (combinaison retenue à l'entraînement → bloc de test suivant)")
+        print(walk.to_string(index=False), "\n")
+        show = ["Profil", *OPT_PARAMS, "Actuel", "IS Trades", "IS Rendement_moy", "IS Score", "Retenu",
+                "OOS Trades", "OOS Réussite", "OOS Rendement_moy", "OOS Score", "Plis OOS > 0"]
+        print("Candidats (classés sur le score en échantillon ; OOS des seuls plis où ils ont été retenus)")
+        print(cands[show].to_string(index=False))
+    print(f"\nCSV écrits dans {a.out}")
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,7 @@ import os, json
 import streamlit as st, pandas as pd, numpy as np, altair as alt
 from lib import (
     fetch_all_markets, style_variations, load_profile, save_profile,
-    news_summary, select_top_actions
+    news_summary, select_top_actions, simulate_outcomes
 )
 
 # ---------------- CONFIG ----------------
@@ -257,6 +257,13 @@ def recompute_returns(df, invest_amount, fee_in, fee_out):
 if not edited.empty:
     edited = recompute_returns(edited, invest_amount, fee_in, fee_out)
 
+    # Monte Carlo : bootstrap des rendements quotidiens, niveaux Entrée/Objectif/Stop + frais
+    mc_cols = ["P(objectif) %", "P(stop) %", "Rendement net espéré (%)", "P5 (%)", "P50 (%)", "P95 (%)"]
+    if st.checkbox("🎲 Simulation Monte Carlo (10 000 trajectoires, ~30 j)", value=False):
+        with st.spinner("Simulation des issues…"):
+            mc = simulate_outcomes(edited, invest_amount, fee_in, fee_out)
+        edited = edited.drop(columns=mc_cols, errors="ignore").join(mc[mc_cols])
+
     def style_gain(v):
         if pd.isna(v): return ""
         if v > 5: return "background-color:#e8f5e9; color:#0b8043; font-weight:600;"
@@ -273,6 +280,12 @@ if not edited.empty:
             f"rendement net estimé **{best.get('Rendement net estimé (%)',0):+.2f}%** "
             f"pour un ticket de **{invest_amount:.0f} €** sur {best.get('Durée visée','7–30 j')}."
         )
+        if pd.notna(best.get("Rendement net espéré (%)", np.nan)):
+            st.caption(
+                f"🎲 Monte Carlo : objectif atteint dans **{best['P(objectif) %']:.0f}%** des trajectoires, "
+                f"stop dans {best['P(stop) %']:.0f}% — espérance nette **{best['Rendement net espéré (%)']:+.2f}%** "
+                f"(P5 {best['P5 (%)']:+.2f}% · P95 {best['P95 (%)']:+.2f}%)."
+            )
 else:
     st.caption("Ajoute une ou plusieurs lignes ci-dessus pour simuler ton investissement.")
 
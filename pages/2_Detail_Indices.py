@@ -9,10 +9,10 @@ Basé sur ta version stable v6.9 :
 - Compatible avec lib v7.6
 """
 
-import streamlit as st, pandas as pd, numpy as np, altair as alt
+import streamlit as st, pandas as pd, altair as alt
 from lib import (
-    fetch_all_markets, price_levels_from_row, decision_label_from_row,
-    style_variations, get_profile_params, load_profile
+    fetch_all_markets, enrich, round_exact,
+    style_variations, load_profile
 )
 
 # ---------------- CONFIG ----------------
@@ -58,57 +58,22 @@ else:
 st.divider()
 
 # ---------------- CLASSEMENT IA ----------------
-rows = []
-volmax = get_profile_params(profil)["vol_max"]
-for _, r in merged.iterrows():
-    levels = price_levels_from_row(r, profil)
-    dec = decision_label_from_row(r, held=False, vol_max=volmax)
-    entry, target, stop = levels["entry"], levels["target"], levels["stop"]
-    px = r.get("Close", np.nan)
-    prox = ((px / entry) - 1) * 100 if np.isfinite(px) and np.isfinite(entry) and entry > 0 else np.nan
-    emoji = "🟢" if abs(prox) <= 2 else ("⚠️" if abs(prox) <= 5 else "🔴")
-
-    # Indicateur long terme 🌱 / 🌧 / ⚖️ basé sur MA120/MA240
-    ma120, ma240 = r.get("MA120", np.nan), r.get("MA240", np.nan)
-    trend_lt = np.nan
-    if np.isfinite(ma120) and np.isfinite(ma240):
-        trend_lt = 1 if ma120 > ma240 else (-1 if ma120 < ma240 else 0)
-    lt_icon = "🌱" if trend_lt > 0 else ("🌧" if trend_lt < 0 else "⚖️")
-
-    # Score IA combiné (court + long terme)
-    gap50 = abs(r.get("MA20", np.nan) - r.get("MA50", np.nan))
-    gap240 = abs(ma120 - ma240) if np.isfinite(ma120) and np.isfinite(ma240) else np.nan
-    score_ia = np.nan
-    if np.isfinite(gap50) and np.isfinite(gap240):
-        score_ia = 100 - min((gap50 + gap240) * 10, 100)
-
-    rows.append({
-        "Société": r.get("name", ""),
-        "Ticker": r["Ticker"],
-        "Cours (€)": round(px, 2) if np.isfinite(px) else None,
-        "Variation (%)": round(r[value_col] * 100, 2) if np.isfinite(r[value_col]) else None,
-        "Entrée (€)": entry,
-        "Objectif (€)": target,
-        "Stop (€)": stop,
-        "Décision IA": dec,
-        "Proximité (%)": round(prox, 2) if np.isfinite(prox) else np.nan,
-        "Signal": emoji,
-        "Tendance LT": lt_icon,
-        "Score IA": round(score_ia, 1) if np.isfinite(score_ia) else np.nan
-    })
-
-out = pd.DataFrame(rows)
+enr = enrich(merged, profil, held=False)  # colonnes IA calculées d'un bloc (lib.enrich)
+out = pd.DataFrame({
+    "Société": enr["name"] if "name" in enr.columns else "",
+    "Ticker": enr["Ticker"],
+    "Cours (€)": round_exact(enr["Close"], 2),
+    "Variation (%)": round_exact(enr[value_col] * 100, 2),
+    **{c: enr[c] for c in ["Entrée (€)", "Objectif (€)", "Stop (€)", "Décision IA", "Proximité (%)"]},
+    "Signal": enr["Signal"].where(enr["Proximité (%)"].notna(), "🔴"),   # proximité inconnue : 🔴 sur cette page
+    **{c: enr[c] for c in ["Tendance LT", "Score IA"]},
+}).reset_index(drop=True)
 if out.empty:
     st.info("Aucune donnée exploitable pour cet indice.")
     st.stop()
 
 # Tri : Acheter > Surveiller > Vendre, puis par proximité
-def sort_key(val):
-    if "Acheter" in val: return 0
-    if "Surveiller" in val: return 1
-    if "Vendre" in val: return 2
-    return 3
-out["sort"] = out["Décision IA"].apply(sort_key)
+out["sort"] = out["Décision IA"].map({"🟢 Acheter": 0, "👁️ Surveiller": 1, "🔴 Vendre": 2}).fillna(3)
 out = out.sort_values(["sort", "Proximité (%)"], ascending=[True, True]).drop(columns="sort")
 
 # ---------------- TABLEAU PRINCIPAL ----------------
@@ -13,8 +13,8 @@ v8.1 — Mon Portefeuille IA stricte & Bench Total/PEA/CTO (ROBUSTE Yahoo)
 
 import os, json, numpy as np, pandas as pd, altair as alt, streamlit as st
 from lib import (
-    fetch_prices, compute_metrics, price_levels_from_row, decision_label_from_row,
-    company_name_from_ticker, get_profile_params, load_profile,
+    fetch_prices, fetch_panel, compute_metrics, enrich, round_exact, portfolio_valuation, BENCHMARKS,
+    company_name_from_ticker, company_names, validate_tickers, load_profile,
     resolve_identifier, find_ticker_by_name, load_mapping, save_mapping, maybe_guess_yahoo
 )
 
@@ -51,8 +51,7 @@ periode = st.sidebar.radio("Période graphique", ["1 jour", "7 jours", "30 jours
 days = {"1 jour": 2, "7 jours": 10, "30 jours": 35}[periode]
 
 bench_name = st.sidebar.selectbox("Indice de comparaison", ["CAC 40", "DAX", "S&P 500", "NASDAQ 100"], index=0)
-bench_map = {"CAC 40": "^FCHI", "DAX": "^GDAXI", "S&P 500": "^GSPC", "NASDAQ 100": "^NDX"}
-bench = bench_map[bench_name]
+bench = BENCHMARKS[bench_name]
 
 st.sidebar.markdown("---")
 st.sidebar.caption("Profil IA chargé automatiquement via lib.load_profile().")
@@ -214,10 +213,10 @@ if edited.empty:
     st.info("Aucun ticker valide dans le portefeuille (lignes vides).")
     st.stop()
 
-def resolve_yahoo(row) -> str | None:
+def yahoo_candidates(row) -> list:
     tkr = str(row.get("Ticker", "")).strip().upper()
     if not tkr:
-        return None
+        return []
 
     # 1) heuristique principale
     y = None
@@ -242,21 +241,13 @@ def resolve_yahoo(row) -> str | None:
 
     # dédoublonnage
     seen = set()
-    cands = [x for x in cands if x and not (x in seen or seen.add(x))]
+    return [x for x in cands if x and not (x in seen or seen.add(x))]
 
-    # 3) validation rapide : un fetch 2 jours (évite les faux tickers)
-    for cand in cands:
-        try:
-            tmp = fetch_prices([cand], days=2)
-            if isinstance(tmp, pd.DataFrame) and (not tmp.empty) and ("Close" in tmp.columns):
-                if tmp["Close"].dropna().shape[0] > 0:
-                    return cand
-        except Exception:
-            pass
-
-    return None
-
-edited["Yahoo"] = edited.apply(resolve_yahoo, axis=1)
+# 3) validation : tous les candidats de toutes les lignes en une seule requête
+#    (verdicts mémorisés sur disque, évite les faux tickers)
+cands_by_row = [yahoo_candidates(r) for r in edited.to_dict(orient="records")]
+valid = validate_tickers([c for cands in cands_by_row for c in cands])
+edited["Yahoo"] = [next((c for c in cands if valid.get(c)), None) for cands in cands_by_row]
 
 bad_rows = edited[edited["Yahoo"].isna()][["Ticker", "Type", "Name"]].copy()
 if not bad_rows.empty:
@@ -295,73 +286,34 @@ edited["Yahoo"] = edited["Yahoo"].astype(str).str.strip()
 merged = edited.merge(met, left_on="Yahoo", right_on="Ticker", how="left", suffixes=("", "_px"))
 
 profil = load_profile()
-volmax = get_profile_params(profil)["vol_max"]
-
-rows = []
-for _, r in merged.iterrows():
-    tkr_orig = r.get("Ticker_x") if "Ticker_x" in r else r.get("Ticker")
-    if pd.isna(tkr_orig):
-        tkr_orig = r.get("Ticker") or r.get("Yahoo")
-    tkr_orig = str(tkr_orig)
-
-    name = r.get("Name") or company_name_from_ticker(r.get("Yahoo"))
-    px = float(r.get("Close", np.nan))
-    qty = float(r.get("Qty", 0))
-    pru = float(r.get("PRU", np.nan))
-
-    levels = price_levels_from_row(r, profil)
-    dec = decision_label_from_row(r, held=True, vol_max=volmax)
-
-    val = px * qty if np.isfinite(px) else np.nan
-    gain = (px - pru) * qty if (np.isfinite(px) and np.isfinite(pru)) else np.nan
-    perf = ((px / pru) - 1) * 100 if (np.isfinite(px) and np.isfinite(pru) and pru > 0) else np.nan
-
-    # LT trend (MA120 vs MA240)
-    ma120, ma240 = float(r.get("MA120", np.nan)), float(r.get("MA240", np.nan))
-    trend_icon = "🌱" if (np.isfinite(ma120) and np.isfinite(ma240) and ma120 > ma240) else (
-        "🌧" if (np.isfinite(ma120) and np.isfinite(ma240) and ma120 < ma240) else "⚖️"
-    )
-
-    entry, target, stop = levels.get("entry", np.nan), levels.get("target", np.nan), levels.get("stop", np.nan)
 
-    prox = ((px / entry) - 1) * 100 if (np.isfinite(px) and np.isfinite(entry) and entry > 0) else np.nan
-    if pd.isna(prox):
-        emoji = "⚪"
-    else:
-        emoji = "🟢" if abs(prox) <= 2 else ("⚠️" if abs(prox) <= 5 else "🔴")
-
-    # 🎯 Priorité d'action
-    if np.isfinite(px) and np.isfinite(target) and px >= target:
-        priority = "🎯 Vendre"
-    elif np.isfinite(perf) and perf > 12 and trend_icon != "🌱":
-        priority = "⚖️ Alléger"
-    elif np.isfinite(px) and np.isfinite(stop) and px <= stop:
-        priority = "🚨 Couper"
-    else:
-        priority = "✅ Conserver"
-
-    rows.append({
-        "Nom": name,
-        "Ticker": tkr_orig,              # saisi
-        "Yahoo": r.get("Yahoo"),         # debug
-        "Type": r.get("Type"),
-        "Décision IA": dec,
-        "🎯 Priorité": priority,
-        "Cours (€)": round(px, 2) if np.isfinite(px) else None,
-        "Qté": qty,
-        "PRU (€)": round(pru, 2) if np.isfinite(pru) else None,
-        "Valeur (€)": round(val, 2) if np.isfinite(val) else None,
-        "Gain (€)": round(gain, 2) if np.isfinite(gain) else None,
-        "Perf%": round(perf, 2) if np.isfinite(perf) else None,
-        "Entrée (€)": entry,
-        "Objectif (€)": target,
-        "Stop (€)": stop,
-        "Proximité (%)": round(prox, 2) if np.isfinite(prox) else None,
-        "Signal Entrée": emoji,
-        "Tendance LT": trend_icon,
-    })
-
-out = pd.DataFrame(rows)
+# Noms manquants résolus en un seul lot (membres d'indices → index disque → Yahoo)
+no_name = merged["Name"].isna() | (merged["Name"].astype(str).str.strip() == "")
+names = company_names(merged.loc[no_name, "Yahoo"].tolist())
+
+enr = enrich(merged, profil, held=True)  # colonnes IA calculées d'un bloc (lib.enrich)
+tkr_orig = enr["Ticker_x"] if "Ticker_x" in enr.columns else enr["Ticker"]
+px, qty, pru = (pd.to_numeric(enr[c], errors="coerce") for c in ("Close", "Qty", "PRU"))
+out = pd.DataFrame({
+    "Nom": np.where(no_name, enr["Yahoo"].map(names).fillna(enr["Yahoo"]), enr["Name"]),
+    "Ticker": tkr_orig.fillna(enr["Yahoo"]).astype(str),   # saisi
+    "Yahoo": enr["Yahoo"],                                  # debug
+    "Type": enr["Type"],
+    "Décision IA": enr["Décision IA"],
+    "🎯 Priorité": enr["🎯 Priorité"],
+    "Cours (€)": round_exact(px, 2),
+    "Qté": qty,
+    "PRU (€)": round_exact(pru, 2),
+    "Valeur (€)": round_exact(px * qty, 2),
+    "Gain (€)": round_exact((px - pru) * qty, 2),
+    "Perf%": enr["Perf%"],
+    "Entrée (€)": enr["Entrée (€)"],
+    "Objectif (€)": enr["Objectif (€)"],
+    "Stop (€)": enr["Stop (€)"],
+    "Proximité (%)": enr["Proximité (%)"],
+    "Signal Entrée": enr["Signal"],
+    "Tendance LT": enr["Tendance LT"],
+}).reset_index(drop=True)
 
 # ==============================
 # STYLES SÛRS
@@ -445,41 +397,15 @@ st.subheader(f"📈 Portefeuille vs {bench_name} ({periode})")
 
 # On benchmarke sur les tickers Yahoo valides
 bench_tickers = edited["Yahoo"].dropna().astype(str).unique().tolist()
-hist_graph = fetch_prices(bench_tickers + [bench], days=days)
+hist_graph = fetch_panel(bench_tickers + [bench], days=days)
 
-if not isinstance(hist_graph, pd.DataFrame) or hist_graph.empty or "Date" not in hist_graph.columns:
+if not len(hist_graph) or not hist_graph.tickers:
     st.caption("Pas assez d'historique.")
 else:
-    df_val = []
-    # On calcule les valeurs à partir des tickers Yahoo (et non le ticker original)
-    for _, r in edited.iterrows():
-        y = str(r.get("Yahoo") or "").strip()
-        if not y:
-            continue
-        q = float(r.get("Qty", 0))
-        tp = str(r.get("Type", "")).strip().upper()
-
-        d = hist_graph[hist_graph["Ticker"] == y].copy()
-        if d.empty:
-            continue
-        d["Valeur"] = d["Close"] * q
-        d["Type"] = tp  # PEA / CTO
-        df_val.append(d[["Date", "Valeur", "Type"]])
-
-    if df_val:
-        D = pd.concat(df_val, ignore_index=True)
-        agg = D.groupby(["Date", "Type"]).agg({"Valeur": "sum"}).reset_index()  # PEA / CTO
-        tot = agg.groupby("Date")["Valeur"].sum().reset_index().assign(Type="Total")  # TOTAL
-
-        bmk = hist_graph[hist_graph["Ticker"] == bench].copy()
-        base_val = float(tot["Valeur"].iloc[0]) if not tot.empty else 1.0
-        bmk = bmk.assign(Type=bench_name, Valeur=bmk["Close"] / bmk["Close"].iloc[0] * base_val)
-
-        full = pd.concat([agg, tot, bmk], ignore_index=True)
-        base = full.groupby("Type").apply(
-            lambda g: g.assign(Pct=(g["Valeur"] / g["Valeur"].iloc[0] - 1) * 100)
-        ).reset_index(drop=True)
+    # Valorisation vectorisée (lib.portfolio_valuation) : cours alignés + report, quantités par compte
+    base = portfolio_valuation(edited, hist_graph, benchmark=bench, bench_name=bench_name)
 
+    if not base.empty:
         def perf_of(t):
             try:
                 return float(base[base["Type"] == t]["Pct"].iloc[-1])
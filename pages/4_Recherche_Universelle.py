@@ -10,8 +10,8 @@ Basée sur ta v7.0 :
 import streamlit as st, pandas as pd, numpy as np, altair as alt, requests, html, re, os, json
 from datetime import datetime
 from lib import (
-    fetch_prices, compute_metrics, price_levels_from_row, decision_label_from_row,
-    company_name_from_ticker, get_profile_params, resolve_identifier,
+    fetch_prices, compute_metrics, enrich,
+    company_name_from_ticker, resolve_identifier,
     find_ticker_by_name, maybe_guess_yahoo, load_profile
 )
 
@@ -151,22 +151,12 @@ st.divider()
 
 # 👇 Profil IA cohérent
 profil = load_profile()
-levels = price_levels_from_row(row, profil)
-entry, target, stop = levels["entry"], levels["target"], levels["stop"]
-decision = decision_label_from_row(row, held=False, vol_max=get_profile_params(profil)["vol_max"])
-
-# 🔸 Tendance long terme 🌱 / 🌧 / ⚖️
-ma120, ma240 = row.get("MA120", np.nan), row.get("MA240", np.nan)
-trend_lt = 1 if ma120 > ma240 else (-1 if ma120 < ma240 else 0)
-lt_icon = "🌱" if trend_lt > 0 else ("🌧" if trend_lt < 0 else "⚖️")
-
-# 🔸 Score IA combiné
+ia = enrich(metrics.iloc[[0]], profil, held=False).iloc[0]   # mêmes colonnes IA que Indices / Portefeuille
+entry, target, stop = ia["Entrée (€)"], ia["Objectif (€)"], ia["Stop (€)"]
+decision = ia["Décision IA"]
+lt_icon = ia["Tendance LT"]          # 🌱 / 🌧 / ⚖️
+score_ia = ia["Score IA"]
 ma20, ma50 = row.get("MA20", np.nan), row.get("MA50", np.nan)
-score_ia = np.nan
-if np.isfinite(ma20) and np.isfinite(ma50) and np.isfinite(ma120) and np.isfinite(ma240):
-    gap_st = abs(ma20 - ma50)
-    gap_lt = abs(ma120 - ma240)
-    score_ia = 100 - min((gap_st + gap_lt) * 10, 100)
 
 cA, cB = st.columns([1.2, 2])
 
@@ -181,10 +171,9 @@ with cA:
         f"- **Score IA global** : {score_ia:.1f}/100"
     )
 
-    prox = ((row["Close"] / entry) - 1) * 100 if entry and entry > 0 else np.nan
+    prox = ia["Proximité (%)"]
     if np.isfinite(prox):
-        emoji = "🟢" if abs(prox) <= 2 else ("⚠️" if abs(prox) <= 5 else "🔴")
-        st.markdown(f"- **Proximité entrée** : {prox:+.2f}% {emoji}")
+        st.markdown(f"- **Proximité entrée** : {prox:+.2f}% {ia['Signal']}")
     else:
         st.caption("Proximité non calculable.")
 
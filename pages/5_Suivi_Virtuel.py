@@ -11,7 +11,7 @@ Fonctionnalités :
 
 import os, json
 import streamlit as st, pandas as pd, numpy as np, altair as alt
-from lib import fetch_all_markets
+from lib import latest_quotes, BENCHMARKS
 
 # ---------------- CONFIG ----------------
 st.set_page_config(page_title="Suivi Virtuel IA", page_icon="💹", layout="wide")
@@ -45,18 +45,13 @@ pf["Société"] = pf["Société"].astype(str)
 
 st.subheader("📘 Portefeuille Virtuel actuel")
 
-# Simulation du cours actuel (fetch marchés principaux)
-st.caption("Les cours sont actualisés via les marchés sélectionnés (CAC 40 + DAX + NASDAQ + S&P 500).")
+# Cours actuel : seulement les lignes du suivi + l'indice de référence
+st.caption("Les cours sont actualisés pour les seules valeurs suivies (et le CAC 40 en référence).")
 
-MARKETS = [("CAC 40", None), ("DAX", None), ("NASDAQ 100", None), ("S&P 500", None)]
-data = fetch_all_markets(MARKETS, days_hist=30)
-for c in ["Ticker","Close"]:
-    if c not in data.columns: data[c] = np.nan
-
-# Cours actuel
 tickers = pf["Ticker"].dropna().unique().tolist()
-current = data[data["Ticker"].isin(tickers)][["Ticker","Close"]].rename(columns={"Close":"Cours actuel (€)"})
-merged = pf.merge(current, on="Ticker", how="left")
+quotes = latest_quotes(tickers, benchmarks=[BENCHMARKS["CAC 40"]])
+current = quotes[~quotes["Benchmark"]][["Ticker","Close"]].rename(columns={"Ticker":"_key","Close":"Cours actuel (€)"})
+merged = pf.assign(_key=pf["Ticker"].str.strip().str.upper()).merge(current, on="_key", how="left").drop(columns="_key")
 
 # Calculs rendement réel
 merged["Entrée (€)"] = pd.to_numeric(merged["Entrée (€)"], errors="coerce")
@@ -116,13 +111,9 @@ st.subheader("📈 Comparatif performance vs CAC 40")
 # Performance portefeuille
 perf_pf = merged["P&L (%)"].mean(skipna=True)
 
-# Performance CAC40
-cac = data[data["Indice"]=="CAC 40"].copy()
-if not cac.empty:
-    cac["Var%"] = (cac["pct_7d"]*100).round(2)
-    perf_cac = cac["Var%"].mean(skipna=True)
-else:
-    perf_cac = np.nan
+# Performance CAC40 (série de l'indice, 7 jours calendaires)
+cac = quotes[quotes["Benchmark"]]
+perf_cac = round(float(cac["pct_7d"].iloc[0])*100, 2) if not cac.empty else np.nan
 
 col1, col2 = st.columns(2)
 with col1:
@@ -0,0 +1,5 @@
+import os, sys, tempfile
+
+# lib crée ses fichiers sous DASH_DATA_DIR à l'import : jamais dans data/ pendant les tests
+os.environ.setdefault("DASH_DATA_DIR", tempfile.mkdtemp(prefix="dash-test-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
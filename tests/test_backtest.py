@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import lib
+
+IND = ["ATR14", "MA20", "MA50", "MA120", "MA240", "pct_7d", "pct_30d"]
+
+def _bars(ticker, dates, seed):
+    rng = np.random.default_rng(seed)
+    n = len(dates)
+    close = 100*np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame({"Date": dates, "Open": close*(1+rng.normal(0, 0.005, n)),
+                         "High": close*(1+rng.uniform(0, 0.02, n)), "Low": close*(1-rng.uniform(0, 0.02, n)),
+                         "Close": close, "Volume": 1e6, "Ticker": ticker})
+
+@pytest.fixture(scope="module")
+def mixed():
+    """Deux calendriers (jours fériés distincts) + un ticker coté plus tard : union de dates trouée."""
+    days = pd.bdate_range("2023-01-02", periods=420)
+    rng = np.random.default_rng(42)
+    eu = days.delete(np.sort(rng.choice(len(days), 12, replace=False)))
+    us = days.delete(np.sort(rng.choice(len(days), 12, replace=False)))
+    df = pd.concat([_bars("AI.PA", eu, 1), _bars("MC.PA", eu, 2),
+                    _bars("AAPL", us, 3), _bars("IPO", us[300:], 4)], ignore_index=True)
+    return df, lib.MarketPanel.from_long(df)
+
+def test_panel_indicators_match_compute_metrics_on_mixed_calendars(mixed):
+    df, panel = mixed
+    ind = lib.panel_indicators(panel)
+    live = lib._panel_live(panel)
+    ipo = df.loc[df["Ticker"] == "IPO", "Date"]
+    for d in [*panel.dates[[60, 150, 251, 300, 333, 419]], *ipo.iloc[[0, 3, 12]]]:   # début de l'IPO : repli 1er cours
+        ref = lib.compute_metrics(df[df["Date"] <= d], horizons={"pct_7d": 7, "pct_30d": 30}).set_index("Ticker")
+        i = panel.row(d)
+        for t in ref.index:
+            j = panel.col(t)
+            if not live[i, j]:
+                assert np.isnan(ind["MA20"][i, j]); continue
+            got = [ind[k][i, j] for k in IND]
+            np.testing.assert_allclose(got, ref.loc[t, IND].to_numpy(float), rtol=1e-9, equal_nan=True,
+                                       err_msg=f"{t} @ {d.date()}")
+
+def test_backtest_counts_each_ticker_on_its_own_sessions(mixed):
+    df, panel = mixed
+    _, trades = lib.backtest_rules(panel, entry_window=3, max_hold=10)
+    assert trades["filled"].sum() > 0
+    for t, g in df.groupby("Ticker"):
+        _, alone = lib.backtest_rules(lib.MarketPanel.from_long(g), entry_window=3, max_hold=10)
+        got = trades[trades["Ticker"] == t].reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, alone.reset_index(drop=True), check_dtype=False)
+
+def test_fresh_signals_ignore_dates_where_the_ticker_did_not_trade():
+    buy = np.array([[1, 1], [0, 1], [1, 0], [1, 1]], dtype=bool)
+    live = np.array([[1, 1], [0, 1], [1, 1], [1, 1]], dtype=bool)
+    fresh = lib._fresh_signals(buy, live)
+    assert fresh.tolist() == [[True, True], [False, False], [False, False], [False, True]]
+
+def _opt_panel():
+    days = pd.bdate_range("2021-01-04", periods=900)
+    rng = np.random.default_rng(7)
+    frames = [_bars(f"T{i}", days.delete(np.sort(rng.choice(len(days), 25, replace=False))), 10+i)
+              for i in range(12)]
+    return lib.MarketPanel.from_long(pd.concat(frames, ignore_index=True))
+
+def test_optimizer_current_setting_matches_backtest_on_mixed_calendars():
+    panel = _opt_panel()
+    only_current = {k: (lib.PROFILE_PARAMS["Neutre"][k],) for k in lib.OPT_PARAMS}
+    cands, walk = lib.optimize_profiles(panel, profiles=["Neutre"], grid=only_current, folds=2,
+                                        min_trades=1, workers=0)
+    folds = walk[walk["Pli"] != "Total"]
+    lo, hi = folds["Test début"].min(), folds["Test fin"].max()
+    _, trades = lib.backtest_rules(panel, profiles=["Neutre"])
+    oos = trades[trades["filled"] & trades["Signal"].between(lo, hi)]
+    cur = cands[cands["Actuel"]].iloc[0]
+    assert cur["Retenu"] == 2                          # seule combinaison : retenue à chaque pli
+    assert cur["OOS Trades"] == len(oos)
+    np.testing.assert_allclose(cur["OOS Rendement_moy"], oos["Rendement"].mean(), rtol=1e-9)
+
+def test_optimizer_ranks_on_in_sample_and_reports_oos_of_picks_only():
+    cands, walk = lib.optimize_profiles(_opt_panel(), profiles=["Neutre"], n_random=40, folds=3,
+                                        min_trades=5, top=5, workers=0)
+    assert cands["IS Score"].dropna().is_monotonic_decreasing     # classement sur l'entraînement
+    picked = walk[walk["Pli"] != "Total"]
+    assert cands["Retenu"].sum() <= len(picked)
+    assert cands.loc[cands["Retenu"] == 0, "OOS Trades"].isna().all()
+    for _, c in cands[cands["Retenu"] > 0].iterrows():
+        mine = picked[(picked[list(lib.OPT_PARAMS)] == c[list(lib.OPT_PARAMS)].to_numpy()).all(axis=1)]
+        assert len(mine) == c["Retenu"] and c["OOS Trades"] == mine["Trades"].sum()
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="projections mémoire lues dans /proc")
+def test_optimizer_pool_workers_do_not_keep_the_shared_block():
+    lib.optimize_profiles(_opt_panel(), profiles=["Neutre"], n_random=4, folds=2, min_trades=1, workers=2)
+    maps = [f.result() for f in [lib._process_pool(2).submit(_shm_mappings) for _ in range(4)]]
+    assert maps == [[]] * 4
+
+def _shm_mappings():
+    with open("/proc/self/maps") as f:
+        return [l for l in f if "/dev/shm/psm_" in l]
+
+@pytest.mark.parametrize("step, level, outcome", [(0.10, "target", 2), (-0.10, "stop", 3)])
+def test_mc_exits_treat_target_and_stop_gaps_alike(step, level, outcome):
+    # rendement constant de ±10 % : le premier cours après l'entrée saute par-dessus le niveau
+    rets = np.full(50, step)
+    res = lib._mc_paths(rets, 100.0, 100.0, 105.0, 95.0, 100.0, 0.0, 0.0, 5, 8, 0)
+    net, filled = res[0], res[1]
+    assert filled.all() and res[outcome].all()
+    np.testing.assert_allclose(net, step * 100)       # sortie à la clôture 110 / 90, pas à 105 / 95
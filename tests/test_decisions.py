@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import lib
+
+def _mixed_metrics(n=400, seed=3):
+    """Cadre compute_metrics synthétique : MAs autour du cours, trous NaN, prix nuls/négatifs."""
+    rng=np.random.default_rng(seed)
+    px=rng.uniform(5, 200, n)
+    ma=lambda: px*(1+rng.normal(0, 0.03, n))
+    df=pd.DataFrame({
+        "Ticker": [f"T{i:03d}" for i in range(n)],
+        "Close": px, "MA20": ma(), "MA50": ma(), "MA120": ma(), "MA240": ma(),
+        "ATR14": px*rng.uniform(0, 0.12, n),
+        "pct_7d": rng.normal(0, 0.03, n), "pct_30d": rng.normal(0, 0.06, n),
+    })
+    for c, frac in (("Close",.05), ("MA20",.1), ("MA50",.1), ("MA120",.15), ("MA240",.2),
+                    ("ATR14",.1), ("pct_7d",.2), ("pct_30d",.2)):
+        df.loc[rng.random(n)<frac, c]=np.nan
+    df.loc[:4, "Close"]=[0.0, -3.0, 0.0, np.nan, -1.0]
+    df.loc[5:9, ["MA20","MA50","MA120","MA240"]]=np.nan       # proximité sans MA20 : base = Close
+    df.loc[10:14, ["Close","MA20"]]=np.nan                    # proximité non calculable
+    df.loc[15:19, "MA240"]=df.loc[15:19, "MA120"]             # MA120 == MA240
+    return df
+
+@pytest.mark.parametrize("held", [False, True])
+def test_decide_profiles_matches_row_rules(held):
+    df=_mixed_metrics()
+    got=lib.decide_profiles(df, list(lib.PROFILE_PARAMS), held=held)
+    for p in lib.PROFILE_PARAMS:
+        ref=[lib.decision_label_strict(r, profile=p, held=held) for _, r in df.iterrows()]
+        assert got[p].tolist()==ref, p
+    # le fixture couvre tous les libellés (Vendre seulement pour une ligne détenue)
+    assert got.stack().nunique()==(3 if held else 2)
+
+@pytest.mark.parametrize("profile", list(lib.PROFILE_PARAMS))
+def test_decide_matches_decision_label_from_row(profile, monkeypatch):
+    df=_mixed_metrics(seed=11)
+    held=np.random.default_rng(0).random(len(df))<0.5
+    monkeypatch.setattr(lib, "load_profile", lambda: profile)
+    got=lib.decide(df, held=held)
+    ref=[lib.decision_label_from_row(r, held=bool(h)) for (_, r), h in zip(df.iterrows(), held)]
+    assert got.tolist()==ref
+
+def test_profile_toggle_is_a_cache_read_without_frame_references():
+    import gc, weakref
+    df=_mixed_metrics().assign(Date=pd.Timestamp("2025-03-07"))
+    lib._enrich_all.cache_clear(); lib._select_all_profiles.cache_clear()
+    h0=lib._enrich_all.cache_info()["hits"]; m0=lib._enrich_all.cache_info()["misses"]
+    got={p: lib.enrich(df.copy(), p) for p in lib.PROFILE_PARAMS}
+    info=lib._enrich_all.cache_info()
+    assert (info["misses"]-m0, info["hits"]-h0)==(1, len(lib.PROFILE_PARAMS)-1)
+    for p, out in got.items():
+        pd.testing.assert_frame_equal(out, lib._enrich_all.__wrapped__(df, False, (p,))[p])
+
+    moved=df.copy(); moved.loc[0, "Close"]+=1.0       # même forme, cours différent -> recalcul
+    lib.enrich(moved, "Neutre")
+    assert lib._enrich_all.cache_info()["misses"]-m0==2
+
+    tmp=df.copy(); ref=weakref.ref(tmp)
+    lib.enrich(tmp, "Prudent", held=True); lib.select_top_actions(tmp, "Agressif")
+    del tmp; gc.collect()
+    assert ref() is None                              # les clés de cache ne retiennent pas le cadre
+
+def _old_indices_rows(merged, profil):
+    """Boucle iterrows de pages/2_Detail_Indices.py avant enrich (colonnes IA)."""
+    decisions=lib.decide(merged, profil, held=False)
+    rows=[]
+    for i, r in merged.iterrows():
+        levels=lib.price_levels_from_row(r, profil)
+        entry, target, stop = levels["entry"], levels["target"], levels["stop"]
+        px=r.get("Close", np.nan)
+        prox=((px / entry) - 1) * 100 if np.isfinite(px) and np.isfinite(entry) and entry > 0 else np.nan
+        emoji="🟢" if abs(prox) <= 2 else ("⚠️" if abs(prox) <= 5 else "🔴")
+        ma120, ma240 = r.get("MA120", np.nan), r.get("MA240", np.nan)
+        trend_lt=np.nan
+        if np.isfinite(ma120) and np.isfinite(ma240):
+            trend_lt=1 if ma120 > ma240 else (-1 if ma120 < ma240 else 0)
+        lt_icon="🌱" if trend_lt > 0 else ("🌧" if trend_lt < 0 else "⚖️")
+        gap50=abs(r.get("MA20", np.nan) - r.get("MA50", np.nan))
+        gap240=abs(ma120 - ma240) if np.isfinite(ma120) and np.isfinite(ma240) else np.nan
+        score_ia=np.nan
+        if np.isfinite(gap50) and np.isfinite(gap240):
+            score_ia=100 - min((gap50 + gap240) * 10, 100)
+        rows.append({
+            "Cours (€)": round(px, 2) if np.isfinite(px) else None,
+            "Entrée (€)": entry, "Objectif (€)": target, "Stop (€)": stop,
+            "Décision IA": decisions.loc[i],
+            "Proximité (%)": round(prox, 2) if np.isfinite(prox) else np.nan,
+            "Signal": emoji, "Tendance LT": lt_icon,
+            "Score IA": round(score_ia, 1) if np.isfinite(score_ia) else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+def _old_portfolio_rows(merged, profil):
+    """Boucle iterrows de pages/3_Mon_Portefeuille.py avant enrich (colonnes IA)."""
+    decisions=lib.decide(merged, profil, held=True)
+    rows=[]
+    for i, r in merged.iterrows():
+        px, qty, pru = float(r.get("Close", np.nan)), float(r.get("Qty", 0)), float(r.get("PRU", np.nan))
+        levels=lib.price_levels_from_row(r, profil)
+        perf=((px / pru) - 1) * 100 if (np.isfinite(px) and np.isfinite(pru) and pru > 0) else np.nan
+        ma120, ma240 = float(r.get("MA120", np.nan)), float(r.get("MA240", np.nan))
+        trend_icon="🌱" if (np.isfinite(ma120) and np.isfinite(ma240) and ma120 > ma240) else (
+            "🌧" if (np.isfinite(ma120) and np.isfinite(ma240) and ma120 < ma240) else "⚖️")
+        entry, target, stop = levels.get("entry", np.nan), levels.get("target", np.nan), levels.get("stop", np.nan)
+        prox=((px / entry) - 1) * 100 if (np.isfinite(px) and np.isfinite(entry) and entry > 0) else np.nan
+        emoji="⚪" if pd.isna(prox) else ("🟢" if abs(prox) <= 2 else ("⚠️" if abs(prox) <= 5 else "🔴"))
+        if np.isfinite(px) and np.isfinite(target) and px >= target: priority="🎯 Vendre"
+        elif np.isfinite(perf) and perf > 12 and trend_icon != "🌱": priority="⚖️ Alléger"
+        elif np.isfinite(px) and np.isfinite(stop) and px <= stop: priority="🚨 Couper"
+        else: priority="✅ Conserver"
+        rows.append({
+            "Décision IA": decisions.loc[i], "🎯 Priorité": priority,
+            "PRU (€)": round(pru, 2) if np.isfinite(pru) else None,
+            "Gain (€)": round((px - pru) * qty, 2) if (np.isfinite(px) and np.isfinite(pru)) else None,
+            "Perf%": round(perf, 2) if np.isfinite(perf) else None,
+            "Entrée (€)": entry, "Objectif (€)": target, "Stop (€)": stop,
+            "Proximité (%)": round(prox, 2) if np.isfinite(prox) else None,
+            "Signal": emoji, "Tendance LT": trend_icon,
+        })
+    return pd.DataFrame(rows)
+
+def _tied_metrics(seed):
+    """Cadre mixte dont MAs / cours / PRU tombent sur des demi-unités (np.round ≠ round)."""
+    df=_mixed_metrics(seed=seed)
+    rng=np.random.default_rng(seed)
+    for c in ("Close","MA20","MA50","MA120","MA240"):
+        df[c]=df[c].round(3)
+    df["PRU"]=np.where(rng.random(len(df))<0.2, np.nan, (df["Close"]*rng.uniform(0.7, 1.2, len(df))).round(3))
+    df["Qty"]=rng.integers(1, 50, len(df)).astype(float)
+    return df
+
+@pytest.mark.parametrize("profile", list(lib.PROFILE_PARAMS))
+def test_enrich_matches_old_page_columns(profile):
+    df=_tied_metrics(seed=5)
+    enr=lib.enrich(df, profile, held=False)
+    ref=_old_indices_rows(df, profile)
+    # table de la page Indices : Cours arrondi et 🔴 quand la proximité est inconnue
+    page=pd.DataFrame({"Cours (€)": lib.round_exact(enr["Close"], 2),
+                       **{c: enr[c] for c in ref.columns if c not in ("Cours (€)", "Signal")},
+                       "Signal": enr["Signal"].where(enr["Proximité (%)"].notna(), "🔴")})
+    pd.testing.assert_frame_equal(page[ref.columns].reset_index(drop=True), ref,
+                                  check_exact=True, check_dtype=False)
+
+    enr=lib.enrich(df, profile, held=True)
+    ref=_old_portfolio_rows(df, profile)
+    px, qty, pru = enr["Close"], enr["Qty"], enr["PRU"]
+    page=enr.assign(**{"PRU (€)": lib.round_exact(pru, 2), "Gain (€)": lib.round_exact((px - pru) * qty, 2)})
+    pd.testing.assert_frame_equal(page[ref.columns].reset_index(drop=True), ref.astype({
+        c: float for c in ("PRU (€)", "Gain (€)", "Perf%", "Proximité (%)")}),
+        check_exact=True, check_dtype=False)
+    gain=((px - pru) * qty).to_numpy()
+    assert (np.round(gain, 2) != lib.round_exact(gain, 2)).any()    # le fixture départage bien les deux arrondis
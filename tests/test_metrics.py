@@ -0,0 +1,167 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import lib
+
+IND = ["Close","ATR14","MA20","MA50","MA120","MA240",
+       "gap20","gap50","gap120","gap240","trend_score","lt_trend_score"]
+
+def _reference(df):
+    """Implémentation groupby/rolling d'origine (avant vectorisation)."""
+    df=df.copy()
+    df["Ticker"]=df["Ticker"].astype(str).str.upper()
+    df=df.sort_values(["Ticker","Date"])
+    df["PrevClose"]=df.groupby("Ticker")["Close"].shift(1)
+    tr1 = df["High"] - df["Low"]
+    tr2 = (df["High"] - df["PrevClose"]).abs()
+    tr3 = (df["Low"]  - df["PrevClose"]).abs()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)     # lignes tout-NaN
+        df["TR"] = np.nanmax(np.vstack([tr1.values, tr2.values, tr3.values]), axis=0)
+    df["ATR14"]=df.groupby("Ticker")["TR"].transform(lambda s:s.rolling(14,min_periods=5).mean())
+    for name, w, mp in (("MA20",20,5), ("MA50",50,10), ("MA120",120,20), ("MA240",240,30)):
+        df[name]=df.groupby("Ticker")["Close"].transform(lambda s:s.rolling(w, min_periods=mp).mean())
+    last=df.groupby("Ticker").tail(1)[["Ticker","Date","Close","ATR14","MA20","MA50","MA120","MA240"]].copy()
+    lib._add_trend_columns(last)
+    return last.reset_index(drop=True)
+
+def _bars(ticker, n, start="2024-01-01", seed=0, nan_frac=0.0, gaps=0):
+    rng=np.random.default_rng(seed)
+    dates=pd.bdate_range(start, periods=n+gaps)
+    if gaps:
+        dates=dates.delete(np.sort(rng.choice(len(dates), gaps, replace=False)))
+    close=100*np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    high=close*(1+rng.uniform(0, 0.02, n)); low=close*(1-rng.uniform(0, 0.02, n))
+    df=pd.DataFrame({"Date": dates, "Open": close, "High": high, "Low": low,
+                     "Close": close, "Volume": 1e6, "Ticker": ticker})
+    if nan_frac:
+        idx=rng.choice(n-1, int(n*nan_frac), replace=False)   # dernière barre renseignée
+        df.loc[idx, ["High","Low","Close"]]=np.nan
+    return df
+
+@pytest.mark.parametrize("frames", [
+    [_bars("AAA", 300), _bars("bbb", 260, seed=1)],
+    [_bars("GAP", 300, seed=2, gaps=40), _bars("NAN", 300, seed=3, nan_frac=0.1)],
+    [_bars("S1", 1), _bars("S4", 4, seed=4), _bars("S12", 12, seed=5), _bars("S35", 35, seed=6)],
+    [_bars("MIX", 250, seed=7, gaps=15, nan_frac=0.05), _bars("TINY", 3, seed=8, nan_frac=0.3)],
+])
+def test_compute_metrics_matches_groupby_rolling(frames):
+    df=pd.concat(frames, ignore_index=True).sample(frac=1, random_state=0)
+    got=lib.compute_metrics(df).set_index("Ticker")
+    ref=_reference(df).set_index("Ticker")
+    assert sorted(got.index)==sorted(ref.index)
+    got=got.loc[ref.index]
+    assert (got["Date"].to_numpy()==ref["Date"].to_numpy()).all()
+    np.testing.assert_allclose(got[IND].to_numpy(float), ref[IND].to_numpy(float),
+                               rtol=1e-9, atol=1e-12, equal_nan=True)
+
+def test_compute_metrics_empty_and_missing_columns():
+    assert lib.compute_metrics(pd.DataFrame()).empty
+    assert lib.compute_metrics(pd.DataFrame({"Ticker": ["A"], "Close": [1.0]})).empty
+
+def test_compute_metrics_precision_on_wide_long_universe():
+    """Univers large et long (sommes cumulées sur des millions de lignes), prix de 5 à 5000."""
+    rng=np.random.default_rng(11)
+    n_t, n_d = 1200, 2500
+    dates=pd.bdate_range("2015-01-01", periods=n_d)
+    close=rng.uniform(5, 5000, n_t)[:, None]*np.exp(np.cumsum(rng.normal(0, 0.02, (n_t, n_d)), axis=1))
+    close[rng.random(close.shape) < 0.01]=np.nan
+    df=pd.DataFrame({"Date": np.tile(dates, n_t), "Ticker": np.repeat([f"T{i:04d}" for i in range(n_t)], n_d),
+                     "High": (close*1.01).ravel(), "Low": (close*0.99).ravel(), "Close": close.ravel()})
+    got=lib.compute_metrics(df).set_index("Ticker")
+    ref=_reference(df).set_index("Ticker").loc[got.index]
+    np.testing.assert_allclose(got[IND].to_numpy(float), ref[IND].to_numpy(float),
+                               rtol=1e-11, atol=1e-12, equal_nan=True)
+
+    gstart=lib._group_starts(df["Ticker"].to_numpy())
+    full=lib._rolling_mean_grouped(df["Close"].to_numpy(), gstart, 240, 30)
+    old=df.groupby("Ticker")["Close"].transform(lambda s: s.rolling(240, min_periods=30).mean()).to_numpy()
+    np.testing.assert_allclose(full, old, rtol=1e-11, equal_nan=True)
+
+def _reference_calendar(last, full):
+    """Recherche ligne à ligne d'origine de _calendar_returns (J/7j/30j)."""
+    full=full.sort_values(["Ticker","Date"])
+
+    def lookup_price(tkr, ref_date, days_back):
+        target=pd.to_datetime(ref_date)-pd.Timedelta(days=days_back)
+        hist=full[full["Ticker"]==tkr][["Date","Close"]].dropna().sort_values("Date")
+        if hist.empty: return np.nan
+        hist=hist[hist["Date"]<=target]
+        if hist.empty:
+            return float(full[full["Ticker"]==tkr]["Close"].iloc[0])
+        return float(hist["Close"].iloc[-1])
+
+    out={}
+    for _, r in last.iterrows():
+        pref=float(r["Close"]); vals=[]
+        for d in (1, 7, 30):
+            p=lookup_price(r["Ticker"], r["Date"], d)
+            v=(pref/p-1) if (np.isfinite(pref) and np.isfinite(p) and p>0) else np.nan
+            if d==1 and np.isfinite(v) and abs(v)>0.4: v=np.nan
+            vals.append(v)
+        out[r["Ticker"]]=vals
+    return pd.DataFrame.from_dict(out, orient="index", columns=["pct_1d","pct_7d","pct_30d"])
+
+def test_calendar_returns_match_row_lookup():
+    rng=np.random.default_rng(5)
+    mon=pd.Timestamp("2024-06-03")                          # dernière séance un lundi
+    days=pd.bdate_range(end=mon, periods=80)
+    hol=days.delete([20, 55, 78])                           # jours fériés (dont vendredi avant le lundi)
+    frames=[
+        pd.DataFrame({"Date": days, "Close": 100+rng.normal(0, 1, 80).cumsum(), "Ticker": "WEEK"}),
+        pd.DataFrame({"Date": hol, "Close": 50+rng.normal(0, 1, 77).cumsum(), "Ticker": "HOL"}),
+        pd.DataFrame({"Date": days[-1:], "Close": [10.0], "Ticker": "ONE"}),
+        pd.DataFrame({"Date": days[-3:], "Close": [np.nan, 20.0, 21.0], "Ticker": "SHORT"}),  # 1er cours NaN
+        pd.DataFrame({"Date": days[-12:], "Close": 30+rng.normal(0, 1, 12), "Ticker": "TWELVE"}),
+        pd.DataFrame({"Date": days[-5:], "Close": [np.nan]*5, "Ticker": "EMPTY"}),
+        pd.DataFrame({"Date": days[-2:], "Close": [10.0, 15.0], "Ticker": "SPLIT"}),      # +50 % sur 1 jour
+    ]
+    full=pd.concat(frames, ignore_index=True)
+    full.loc[full.sample(frac=0.05, random_state=1).index.difference(full.groupby("Ticker").tail(1).index), "Close"]=np.nan
+    last=full.sort_values("Date").groupby("Ticker").tail(1)[["Ticker","Date","Close"]].reset_index(drop=True)
+    got=lib._calendar_returns(last.copy(), full).set_index("Ticker")[["pct_1d","pct_7d","pct_30d"]]
+    ref=_reference_calendar(last, full).loc[got.index]
+    np.testing.assert_allclose(got.to_numpy(float), ref.to_numpy(float), rtol=1e-12, equal_nan=True)
+
+def _assert_same(got, ref):
+    assert got["Ticker"].tolist()==ref["Ticker"].tolist()
+    assert (pd.to_datetime(got["Date"]).to_numpy()==pd.to_datetime(ref["Date"]).to_numpy()).all()
+    cols=IND+["pct_1d","pct_7d","pct_30d"]
+    np.testing.assert_allclose(got[cols].to_numpy(float), ref[cols].to_numpy(float),
+                               rtol=1e-9, atol=1e-12, equal_nan=True)
+
+def test_indicator_state_sync_matches_compute_metrics():
+    full=pd.concat([_bars("AAA", 300), _bars("BBB", 300, seed=1, gaps=10),
+                    _bars("CCC", 300, seed=2, nan_frac=0.05)], ignore_index=True)
+    days=sorted(full["Date"].unique())
+    hist=full[full["Date"]<=days[-3]]
+    state=lib.IndicatorState()
+    _assert_same(state.sync(hist), lib.compute_metrics(hist))
+    kept=dict(state.states)
+
+    # intraday : la dernière barre est remplacée ; puis une nouvelle séance
+    intraday=hist.copy(); last=intraday.groupby("Ticker")["Date"].transform("max")==intraday["Date"]
+    intraday.loc[last, "Close"]*=1.01
+    _assert_same(state.sync(intraday), lib.compute_metrics(intraday))
+    step=pd.concat([intraday, full[full["Date"]==days[-2]]], ignore_index=True)
+    _assert_same(state.sync(step), lib.compute_metrics(step))
+    assert all(state.states[t] is kept[t] for t in kept)          # avancés en place, pas ré-initialisés
+
+    # ré-ajustement (dividende) sur AAA, nouveau ticker, ticker retiré, fenêtre décalée
+    adj=step.copy(); adj.loc[adj["Ticker"]=="AAA", ["High","Low","Close"]]*=0.98
+    adj=pd.concat([adj[adj["Ticker"]!="CCC"], _bars("DDD", 40, start="2025-01-01", seed=9)], ignore_index=True)
+    _assert_same(state.sync(adj), lib.compute_metrics(adj))
+    assert state.states["BBB"] is kept["BBB"] and "CCC" not in state.states
+    shifted=adj[adj["Date"]>days[5]]
+    _assert_same(state.sync(shifted), lib.compute_metrics(shifted))
+
+def test_universe_metrics_keeps_one_state_per_universe():
+    df=pd.concat([_bars("AAA", 80), _bars("BBB", 80, seed=1)], ignore_index=True)
+    key=(("AAA","BBB"), 240)
+    _assert_same(lib.universe_metrics(key, df), lib.compute_metrics(df))
+    st=lib._indicator_states[key]
+    _assert_same(lib.universe_metrics(key, df), lib.compute_metrics(df))
+    assert lib._indicator_states[key] is st
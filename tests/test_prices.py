@@ -0,0 +1,99 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import lib
+
+LAST = pd.Timestamp.today().normalize()
+
+class FakeProvider:
+    """download() façon yf.download(group_by="ticker") : `known` ont des barres, `down` lève."""
+    def __init__(self, known=(), down=False, empty=False):
+        self.known, self.down, self.empty, self.calls = set(known), down, empty, []
+
+    def download(self, tickers, **kw):
+        self.calls.append((list(tickers), kw))
+        if self.down: raise ConnectionError("offline")
+        dates = pd.bdate_range(end=LAST, periods=60, name="Date")
+        bars = {t: pd.DataFrame({"Open": 1.0, "High": 1.0, "Low": 1.0, "Close": 1.0, "Volume": 1.0}, index=dates)
+                for t in tickers if t in self.known and not self.empty}
+        # yfinance garde une colonne (vide) par ticker demandé, même en échec
+        empty = pd.DataFrame(np.nan, index=dates, columns=["Open", "High", "Low", "Close", "Volume"])
+        frame = pd.concat({t: bars.get(t, empty) for t in tickers}, axis=1)
+        return frame.dropna(how="all") if not bars else frame
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(lib, "PRICES_DIR", str(tmp_path))
+    monkeypatch.setattr(lib, "PRICES_INDEX_PATH", str(tmp_path / "_index.json"))
+    monkeypatch.setattr(lib, "TICKER_CHECK_PATH", str(tmp_path / "ticker_check.json"))
+    monkeypatch.setattr(lib, "_store_idx", {})
+    monkeypatch.setattr(lib, "_check_idx", {})
+    monkeypatch.setattr(lib, "_check_retry", {})
+    monkeypatch.setattr(lib, "DL_BACKOFF", 0.0)
+    lib._ticker_history.cache_clear(); lib.fetch_prices_cached.cache_clear()
+    prev = lib.get_provider()
+    yield
+    lib.set_provider(prev)
+    lib._ticker_history.cache_clear(); lib.fetch_prices_cached.cache_clear()
+
+@pytest.mark.parametrize("provider", [FakeProvider(down=True), FakeProvider(known={"AAPL", "MSFT"}, empty=True)])
+def test_outage_is_not_cached_as_unknown(store, provider):
+    lib.set_provider(provider)
+    assert lib.validate_tickers(["AAPL", "MSFT"]) == {"AAPL": False, "MSFT": False}
+    assert lib._check_index() == {}
+    assert not (lib.os.path.exists(lib.TICKER_CHECK_PATH)
+                and json.load(open(lib.TICKER_CHECK_PATH)))
+    n = len(provider.calls)
+    lib.validate_tickers(["AAPL", "MSFT"])                 # pas de nouvel essai avant CHECK_RETRY
+    assert len(provider.calls) == n
+    assert lib.fetch_prices(["AAPL"], 30).empty
+    assert not any(m.get("empty") for m in lib._store_index().values())
+
+def test_unknown_symbol_cached_when_batch_answered(store):
+    lib.set_provider(FakeProvider(known={"AI.PA"}))
+    assert lib.validate_tickers(["AI.PA", "AI"]) == {"AI.PA": True, "AI": False}
+    assert lib._check_index()["AI"]["ok"] is False
+    assert lib._store_index()["AI"]["empty"]
+
+def test_empty_delta_keeps_fetched_unless_batch_answered(store):
+    lib.set_provider(FakeProvider(known={"AAA", "BBB"}))
+    lib.fetch_prices(["AAA", "BBB"], 30)
+    idx = lib._store_index()
+    for t in idx: idx[t]["fetched"] -= lib.PRICE_STORE_TTL + 1
+    with open(lib.PRICES_INDEX_PATH, "w") as f: json.dump(idx, f)     # sinon _store_flush reprend le disque
+    old = {t: m["fetched"] for t, m in idx.items()}
+
+    lib.set_provider(FakeProvider(known={"AAA", "BBB"}, empty=True))      # coupure : rien ne répond
+    lib.refresh_prices(["AAA", "BBB"], 30)
+    assert {t: m["fetched"] for t, m in idx.items()} == old
+
+    lib.set_provider(FakeProvider(known={"AAA"}))                          # BBB suspendu, AAA répond
+    lib.refresh_prices(["AAA", "BBB"], 30)
+    assert idx["AAA"]["fetched"] > old["AAA"] and idx["BBB"]["fetched"] > old["BBB"]
+
+def test_replay_ignores_delta_start_date(tmp_path):
+    rec = lib.RecordingProvider(str(tmp_path), inner=FakeProvider(known={"AAA"}))
+    sent = rec.download(["AAA"], start="2026-01-05", interval="1d")
+    got = lib.ReplayProvider(str(tmp_path), strict=True).download(["AAA"], start="2026-01-12", interval="1d")
+    pd.testing.assert_frame_equal(got, sent)
+
+def test_fetch_panel_matches_long_format(store):
+    class Mixed(FakeProvider):
+        def download(self, tickers, **kw):
+            frame = super().download(tickers, **kw)
+            frame.loc[frame.index[::7], [c for c in frame.columns if c[0] == "BBB"]] = np.nan  # autre calendrier
+            return frame
+    lib.set_provider(Mixed(known={"AAA", "BBB", "^FCHI"}))
+    panel = lib.fetch_panel(["bbb", "AAA", "^FCHI"], days=40)
+    ref = lib.MarketPanel.from_long(lib.fetch_prices(["AAA", "BBB", "^FCHI"], days=40))
+    assert panel.tickers == ref.tickers and panel.dates.equals(ref.dates)
+    for f in lib._OHLCV:
+        np.testing.assert_array_equal(panel[f], ref[f])
+
+    pos = pd.DataFrame({"Yahoo": ["AAA", "BBB"], "Qty": [3, 5], "Type": ["PEA", "CTO"]})
+    pd.testing.assert_frame_equal(lib.portfolio_valuation(pos, panel, benchmark="^FCHI"),
+                                  lib.portfolio_valuation(pos, lib.fetch_prices(["AAA", "BBB", "^FCHI"], 40),
+                                                          benchmark="^FCHI"))